@@ -0,0 +1,244 @@
+import os
+import sys
+import heapq
+import itertools
+import threading
+from concurrent.futures import ProcessPoolExecutor, Future, InvalidStateError
+from loguru import logger
+
+# 优先级：数值越小越先执行
+PLAYING = 0  # 正在播放
+NEXT = 1  # 播放队列中的下一首
+VISIBLE = 2  # 界面上可见
+BACKGROUND = 3  # 后台曲库分析
+
+ANALYSES = ("pcm", "peaks", "beats", "loudness", "cover", "duration", "library")
+
+
+def _lower_priority() -> None:
+    """工作进程初始化：降低自身（及其启动的ffmpeg）的调度优先级，让出CPU给播放"""
+    try:
+        if hasattr(os, "nice"):
+            os.nice(10)
+        elif sys.platform == "win32":
+            import ctypes
+            BELOW_NORMAL_PRIORITY_CLASS = 0x4000
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), BELOW_NORMAL_PRIORITY_CLASS)
+    except OSError as e:
+        logger.error(f"降低分析进程优先级失败: {e}")
+
+
+def run_analysis(kind: str, target: str):
+    """
+    在工作进程中执行一项分析，结果由各模块写入 cache/ 下的缓存
+    :param kind: 分析类型，见 ANALYSES
+    :param target: 音乐文件路径，library 为曲库文件夹
+    :return: 缓存路径或分析结果
+    """
+    if kind == "pcm":
+        from PcmCache import load_pcm, pcm_cache_path
+        load_pcm(target)
+        return pcm_cache_path(target)
+    if kind == "peaks":
+        from PcmCache import load_pcm
+        from WaveformPeaks import get_peaks, peaks_cache_path
+        get_peaks(target, lambda: load_pcm(target))
+        return peaks_cache_path(target)
+    if kind == "beats":
+        from BeatTrack import get_beats, beats_cache_path
+        get_beats(target)
+        return beats_cache_path(target)
+    if kind == "loudness":
+        from Loudness import get_loudness
+        return get_loudness(target)
+    if kind == "cover":
+        from MediaTools import get_music_cover
+        return get_music_cover(target)
+    if kind == "duration":
+        from MediaTools import get_audio_duration
+        return get_audio_duration(target)
+    if kind == "library":
+        from LibrarySearch import scan_library
+        return len(scan_library(target))
+    raise ValueError(f"未知的分析类型：{kind}")
+
+
+class AnalysisJob:
+    """一项排队或运行中的分析，相同 (kind, target) 只存在一个"""
+    def __init__(self, kind: str, target: str, priority: int):
+        self.key = (kind, os.path.abspath(target))
+        self.kind = kind
+        self.target = target
+        self.priority = priority
+        self.groups = set()  # 关心该任务的分组，全部取消后任务才取消
+        self.pinned = False  # 有不属于任何分组的提交时不随分组取消
+        self.running = False
+        self.future = Future()
+
+
+class AnalysisScheduler:
+    """
+    后台分析调度器。
+    任务按优先级进入堆，只有空闲的工作进程才会取走任务，高优先级的任务不会排在大量后台任务之后；
+    工作进程数为CPU核心数减一（至少2个）并降低调度优先级，后台任务最多占用其中 workers - 1 个，
+    始终为正在播放和下一首的分析留出一个进程，播放与界面线程不会被曲库分析占满。
+    相同的任务只执行一次，重复提交返回同一个Future并提升优先级；
+    取消排队中的任务直接移出队列；运行中的任务无法中断，只丢弃原Future上的回调，
+    任务仍留在 jobs 中，期间重新提交会拿到新的Future而不会重复运行，完成后结果照常写入缓存。
+    """
+    def __init__(self, workers: int = None):
+        """
+        :param workers: 工作进程数，默认为CPU核心数减一，至少为2，保证后台任务之外总有一个空闲进程
+        """
+        self.workers = max(workers or (os.cpu_count() or 2) - 1, 2)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_lower_priority)
+        self.heap = []  # (优先级, 序号, 任务)，优先级变化后旧条目留在堆中，取出时跳过
+        self.jobs = {}  # (kind, 绝对路径) -> 排队或运行中的任务
+        self.running = 0
+        self.backgroundRunning = 0
+        self.sequence = itertools.count()
+        self.lock = threading.RLock()
+        self.closed = False
+
+    def submit(self, kind: str, target: str, priority: int = BACKGROUND, group: str = None) -> Future:
+        """
+        提交一项分析
+        :param kind: 分析类型，见 ANALYSES
+        :param target: 音乐文件路径，library 为曲库文件夹
+        :param priority: PLAYING / NEXT / VISIBLE / BACKGROUND
+        :param group: 分组，如 "player-next"，用于在切换曲目时整体取消
+        :return: Future，结果为 run_analysis 的返回值
+        """
+        if kind not in ANALYSES:
+            raise ValueError(f"未知的分析类型：{kind}")
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("分析调度器已关闭")
+            key = (kind, os.path.abspath(target))
+            job = self.jobs.get(key)
+            if job is None:
+                job = self.jobs[key] = AnalysisJob(kind, target, priority)
+                heapq.heappush(self.heap, (priority, next(self.sequence), job))
+            elif priority < job.priority and job.running is False:
+                job.priority = priority
+                heapq.heappush(self.heap, (priority, next(self.sequence), job))
+            if group is None:
+                job.pinned = True
+            else:
+                job.groups.add(group)
+            self._dispatch()
+            return job.future
+
+    def _dispatch(self) -> None:
+        """在持有锁时调用：把堆顶的任务交给空闲的工作进程"""
+        while self.heap and self.running < self.workers:
+            priority, _, job = self.heap[0]
+            if self.jobs.get(job.key) is not job or job.running or priority != job.priority:
+                heapq.heappop(self.heap)
+                continue
+            if priority == BACKGROUND and self.backgroundRunning >= self.workers - 1:
+                break
+            heapq.heappop(self.heap)
+            job.running = True
+            self.running += 1
+            if priority == BACKGROUND:
+                self.backgroundRunning += 1
+            logger.info(f"开始分析：{job.kind} {job.target}")
+            self.executor.submit(run_analysis, job.kind, job.target).add_done_callback(
+                lambda future, job=job: self._finished(job, future)
+            )
+
+    def _finished(self, job: AnalysisJob, future: Future) -> None:
+        with self.lock:
+            self.running -= 1
+            if job.priority == BACKGROUND:
+                self.backgroundRunning -= 1
+            if self.jobs.get(job.key) is job:
+                del self.jobs[job.key]
+            if self.closed is False:
+                self._dispatch()
+        try:
+            if future.cancelled():
+                job.future.cancel()
+            elif future.exception() is not None:
+                if self.closed:
+                    job.future.cancel()
+                    return
+                logger.error(f"分析{job.kind} {job.target}失败: {future.exception()}")
+                job.future.set_exception(future.exception())
+            else:
+                job.future.set_result(future.result())
+        except InvalidStateError:
+            pass  # 运行中被取消的任务
+
+    def _cancel(self, job: AnalysisJob) -> None:
+        """在持有锁时调用"""
+        job.future.cancel()
+        job.groups.clear()
+        job.pinned = False
+        if job.running:
+            job.future = Future()
+        else:
+            del self.jobs[job.key]
+
+    def cancel(self, kind: str, target: str) -> None:
+        """
+        取消一项分析
+        :param kind: 分析类型
+        :param target: 音乐文件路径
+        :return: None
+        """
+        with self.lock:
+            job = self.jobs.get((kind, os.path.abspath(target)))
+            if job is not None:
+                self._cancel(job)
+
+    def cancel_group(self, group: str) -> None:
+        """
+        取消分组内的任务，仍被其他分组或无分组提交需要的任务保留
+        :param group: 分组
+        :return: None
+        """
+        with self.lock:
+            for job in list(self.jobs.values()):
+                if group not in job.groups:
+                    continue
+                job.groups.discard(group)
+                if not job.groups and job.pinned is False:
+                    self._cancel(job)
+
+    def pending(self) -> int:
+        with self.lock:
+            return sum(1 for job in self.jobs.values() if job.running is False)
+
+    def shutdown(self) -> None:
+        """
+        取消所有任务并结束工作进程，不等待运行中的任务（例如整个曲库的扫描），
+        否则解释器退出时会一直等到它们完成。被中断的任务只留下以进程号命名的临时文件
+        :return: None
+        """
+        with self.lock:
+            self.closed = True
+            for job in list(self.jobs.values()):
+                self._cancel(job)
+            self.heap = []
+        # ProcessPoolExecutor 没有公开终止工作进程的接口
+        processes = list((getattr(self.executor, "_processes", None) or {}).values())
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def analysis_scheduler() -> AnalysisScheduler:
+    """获取全局的AnalysisScheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None or _scheduler.closed:
+            _scheduler = AnalysisScheduler()
+        return _scheduler
@@ -0,0 +1,201 @@
+import os
+import numpy as np
+from loguru import logger
+from PcmCache import load_pcm, track_cache_key
+
+PATH = os.path.split(__file__)[0]
+
+BEATS_VERSION = 1
+FRAME_SIZE = 2048
+HOP_SIZE = 441  # 44100Hz 时每帧10ms
+STFT_FRAMES = 2048  # 每次计算的帧数，限制临时内存
+THRESHOLD_WINDOW = 25  # 自适应阈值的半窗口（帧）
+THRESHOLD_DELTA = 0.05  # 阈值在局部中位数之上的偏移，按包络最大值归一化
+PEAK_WINDOW = 3  # 峰值需在前后多少帧内最大
+MIN_BPM, MAX_BPM = 60, 200
+
+
+def onset_envelope(samples: np.ndarray, sampleRate: int) -> tuple:
+    """
+    计算谱通量起始点包络：对数幅度谱逐帧的正向增量之和
+    :param samples: int16 单声道采样
+    :param sampleRate: 采样率
+    :return: (包络, 包络采样率)
+    """
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+    envelope = []
+    previous = None
+    step = STFT_FRAMES * HOP_SIZE
+    for start in range(0, max(len(samples) - FRAME_SIZE, 0) + 1, step):
+        chunk = np.asarray(samples[start:start + step + FRAME_SIZE], dtype=np.float32) / 32768
+        if len(chunk) < FRAME_SIZE:
+            break
+        frames = np.lib.stride_tricks.sliding_window_view(chunk, FRAME_SIZE)[::HOP_SIZE][:STFT_FRAMES]
+        spectrum = np.log1p(100 * np.abs(np.fft.rfft(frames * window, axis=1)))
+        if previous is not None:
+            spectrum = np.vstack((previous, spectrum))
+        flux = np.maximum(np.diff(spectrum, axis=0), 0).sum(axis=1)
+        if previous is None:
+            flux = np.concatenate(([0.0], flux))
+        envelope.append(flux)
+        previous = spectrum[-1:]
+    if not envelope:
+        return np.zeros(0, dtype=np.float32), sampleRate / HOP_SIZE
+    envelope = np.concatenate(envelope).astype(np.float32)
+    peak = envelope.max()
+    return (envelope / peak if peak > 0 else envelope), sampleRate / HOP_SIZE
+
+
+def pick_onsets(envelope: np.ndarray) -> np.ndarray:
+    """
+    自适应阈值峰值检测：高于局部中位数加偏移，且是邻域内的最大值
+    :param envelope: 归一化的起始点包络
+    :return: 起始点帧号
+    """
+    if len(envelope) == 0:
+        return np.zeros(0, dtype=np.int64)
+    padded = np.pad(envelope, THRESHOLD_WINDOW, mode="edge")
+    threshold = np.median(
+        np.lib.stride_tricks.sliding_window_view(padded, 2 * THRESHOLD_WINDOW + 1), axis=1
+    ) + THRESHOLD_DELTA
+    padded = np.pad(envelope, PEAK_WINDOW, mode="constant")
+    localMax = np.lib.stride_tricks.sliding_window_view(padded, 2 * PEAK_WINDOW + 1).max(axis=1)
+    return np.flatnonzero((envelope >= threshold) & (envelope == localMax))
+
+
+def estimate_tempo(envelope: np.ndarray, frameRate: float) -> tuple:
+    """
+    用包络的自相关估计节拍周期，再选取与包络最吻合的相位
+    :param envelope: 起始点包络
+    :param frameRate: 包络采样率
+    :return: (BPM, 周期帧数, 第一拍帧号)，无法估计时BPM为0
+    """
+    minLag = int(frameRate * 60 / MAX_BPM)
+    maxLag = int(frameRate * 60 / MIN_BPM)
+    if len(envelope) <= maxLag * 2:
+        return 0.0, 0.0, 0.0
+    centered = envelope - envelope.mean()
+    size = 1 << int(np.ceil(np.log2(2 * len(centered))))
+    spectrum = np.fft.rfft(centered, size)
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum), size)[:maxLag + 1]
+    # 以120BPM为中心的对数高斯加权，减少倍频误判
+    lags = np.arange(minLag, maxLag + 1)
+    weight = np.exp(-0.5 * (np.log2(lags / (frameRate * 0.5))) ** 2)
+    lag = lags[np.argmax(autocorr[minLag:maxLag + 1] * weight)]
+
+    # 在整数滞后附近用抛物线插值得到更精确的周期
+    period = float(lag)
+    if minLag < lag < maxLag:
+        left, middle, right = autocorr[lag - 1], autocorr[lag], autocorr[lag + 1]
+        denominator = left - 2 * middle + right
+        if denominator != 0:
+            period += 0.5 * (left - right) / denominator
+
+    count = int((len(envelope) - 1) / period)
+    phases = np.arange(int(np.ceil(period)))
+    positions = np.round(phases[:, None] + np.arange(count)[None, :] * period).astype(np.int64)
+    positions = np.minimum(positions, len(envelope) - 1)
+    phase = phases[np.argmax(envelope[positions].sum(axis=1))]
+    return 60 * frameRate / period, period, float(phase)
+
+
+class BeatTrack:
+    """单首曲目的起始点、节拍与速度"""
+    def __init__(self, onsets: np.ndarray, beats: np.ndarray, tempo: float):
+        """
+        :param onsets: 起始点时间（秒）
+        :param beats: 节拍时间（秒）
+        :param tempo: 速度（BPM）
+        """
+        self.onsets = onsets
+        self.beats = beats
+        self.tempo = tempo
+
+    def beat_phase(self, seconds: float) -> tuple:
+        """
+        查询某一时刻所在的拍及拍内相位
+        :param seconds: 秒数
+        :return: (拍序号, 0~1的相位)，没有节拍时为 (-1, 0.0)
+        """
+        index = int(np.searchsorted(self.beats, seconds, side="right")) - 1
+        if index < 0 or index + 1 >= len(self.beats):
+            return -1, 0.0
+        start, end = self.beats[index], self.beats[index + 1]
+        return index, float((seconds - start) / (end - start))
+
+    def next_beat(self, seconds: float) -> float or None:
+        """
+        获取某一时刻之后的第一拍，用于在拍点上衔接歌曲
+        :param seconds: 秒数
+        :return: float or None
+        """
+        index = int(np.searchsorted(self.beats, seconds, side="left"))
+        return float(self.beats[index]) if index < len(self.beats) else None
+
+
+def analyze_beats(samples: np.ndarray, sampleRate: int) -> BeatTrack:
+    """
+    一次向量化遍历完成起始点检测与速度估计
+    :param samples: int16 单声道采样
+    :param sampleRate: 采样率
+    :return: BeatTrack
+    """
+    envelope, frameRate = onset_envelope(samples, sampleRate)
+    latency = FRAME_SIZE / 2 / sampleRate  # 帧号对应窗口起点，换算到窗口中心
+    onsets = pick_onsets(envelope) / frameRate + latency
+    tempo, period, phase = estimate_tempo(envelope, frameRate)
+    if tempo <= 0:
+        return BeatTrack(onsets, np.zeros(0), tempo)
+
+    beats = (phase + np.arange(int((len(envelope) - 1 - phase) / period) + 1) * period) / frameRate + latency
+    if len(onsets):
+        # 节拍网格吸附到附近的起始点，抵消周期估计的累积误差
+        index = np.searchsorted(onsets, beats)
+        left = onsets[np.maximum(index - 1, 0)]
+        right = onsets[np.minimum(index, len(onsets) - 1)]
+        nearest = np.where(np.abs(beats - left) < np.abs(beats - right), left, right)
+        snap = np.abs(nearest - beats) < 0.15 * period / frameRate
+        beats = np.where(snap, nearest, beats)
+    return BeatTrack(onsets, beats, tempo)
+
+
+def beats_cache_path(music_file: str) -> str:
+    cache_dir = os.path.join(PATH, "cache", "beats")
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, track_cache_key(music_file) + ".npz")
+
+
+def get_beats(music_file: str) -> BeatTrack or None:
+    """
+    获取曲目的节拍信息，缓存失效时才重新分析
+    :param music_file: 音乐文件路径
+    :return: BeatTrack or None
+    """
+    path = beats_cache_path(music_file)
+    try:
+        stat = os.stat(music_file)
+    except OSError as e:
+        logger.error(f"获取节拍失败: {e}")
+        return None
+
+    if os.path.isfile(path):
+        try:
+            with np.load(path) as data:
+                if data["version"] == BEATS_VERSION and data["size"] == stat.st_size \
+                        and data["mtime"] == stat.st_mtime:
+                    logger.info(f"读取{music_file}的节拍缓存")
+                    return BeatTrack(data["onsets"], data["beats"], float(data["tempo"]))
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"读取节拍缓存失败: {e}")
+
+    logger.info(f"分析{music_file}的节拍")
+    samples, sampleRate = load_pcm(music_file)
+    track = analyze_beats(samples, sampleRate)
+    temp = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(
+        temp, version=BEATS_VERSION, size=stat.st_size, mtime=stat.st_mtime,
+        onsets=track.onsets, beats=track.beats, tempo=track.tempo
+    )
+    os.replace(temp, path)
+    logger.info(f"速度：{track.tempo:.1f} BPM，起始点{len(track.onsets)}个")
+    return track
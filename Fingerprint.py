@@ -0,0 +1,338 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from loguru import logger
+from PcmCache import read_pcm
+from Transcoder import collect_sources
+
+PATH = os.path.split(__file__)[0]
+
+DECIMATE = 4  # 44100Hz 降采样到 11025Hz
+FRAME_SIZE = 1024
+HOP_SIZE = 512  # 约46ms
+BAND_EDGES = np.array([1, 16, 32, 64, 128, 256, 512])  # 频带边界（频点）
+FAN_OUT = 5  # 每个锚点与之后多少个峰值组成哈希
+MAX_DELTA = 63  # 峰值对的最大帧间隔，占6位
+STFT_FRAMES = 4096  # 每次计算的帧数，限制临时内存
+MATCH_THRESHOLD = 0.15  # 对齐后命中的哈希比例超过该值视为重复
+
+
+def fingerprint_samples(samples: np.ndarray, sampleRate: int) -> tuple:
+    """
+    计算频谱峰值指纹：每帧每个频带取最强的峰值，相邻峰值两两组合成哈希
+    :param samples: int16 单声道采样
+    :param sampleRate: 采样率
+    :return: (哈希数组 uint32, 锚点帧号数组 uint32)
+    """
+    usable = len(samples) - len(samples) % DECIMATE
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+    peakTimes, peakFreqs = [], []
+
+    step = STFT_FRAMES * HOP_SIZE * DECIMATE
+    for start in range(0, usable, step):
+        # 取平均降采样，顺带起到低通作用
+        chunk = np.asarray(samples[start:min(start + step + FRAME_SIZE * DECIMATE, usable)], dtype=np.float32)
+        chunk = chunk.reshape(-1, DECIMATE).mean(axis=1)
+        if len(chunk) < FRAME_SIZE:
+            break
+        frames = np.lib.stride_tricks.sliding_window_view(chunk, FRAME_SIZE)[::HOP_SIZE][:STFT_FRAMES]
+        spectrum = np.log1p(np.abs(np.fft.rfft(frames * window, axis=1)))
+
+        for low, high in zip(BAND_EDGES[:-1], BAND_EDGES[1:]):
+            band = spectrum[:, low:high]
+            freqs = band.argmax(axis=1)
+            strength = band[np.arange(len(band)), freqs]
+            keep = strength > strength.mean() + 0.5 * strength.std()
+            peakTimes.append(np.flatnonzero(keep) + start // (HOP_SIZE * DECIMATE))
+            peakFreqs.append(freqs[keep] + low)
+
+    if not peakTimes:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32)
+    times = np.concatenate(peakTimes).astype(np.int64)
+    freqs = np.concatenate(peakFreqs).astype(np.int64)
+    order = np.lexsort((freqs, times))
+    times, freqs = times[order], freqs[order]
+
+    hashes, anchors = [], []
+    for offset in range(1, FAN_OUT + 1):
+        delta = times[offset:] - times[:-offset]
+        valid = (delta > 0) & (delta <= MAX_DELTA)
+        f1, f2 = freqs[:-offset][valid], freqs[offset:][valid]
+        hashes.append((f1 << 15) | (f2 << 6) | delta[valid])
+        anchors.append(times[:-offset][valid])
+    return np.concatenate(hashes).astype(np.uint32), np.concatenate(anchors).astype(np.uint32)
+
+
+def fingerprint_file(music_file: str) -> tuple:
+    """
+    进程池任务：已有解码缓存时直接使用，否则临时解码，不写入缓存
+    :param music_file: 文件路径
+    :return: (路径, 哈希数组, 锚点帧号数组) ，失败时哈希为None
+    """
+    try:
+        samples, sampleRate = read_pcm(music_file)
+        hashes, anchors = fingerprint_samples(samples, sampleRate)
+        return music_file, hashes, anchors
+    except Exception as e:
+        logger.error(f"计算{music_file}指纹失败: {e}")
+        return music_file, None, None
+
+
+class FingerprintIndex:
+    """
+    指纹哈希索引：所有哈希按值排序存放，查询时用二分查找定位，
+    再按 (曲目, 时间差) 投票判断是否为同一首歌
+    """
+    def __init__(self):
+        self.hashes = np.zeros(0, dtype=np.uint32)
+        self.tracks = np.zeros(0, dtype=np.uint32)
+        self.times = np.zeros(0, dtype=np.uint32)
+        self.paths = []  # 曲目号 -> 路径
+        self.counts = []  # 曲目号 -> 哈希数量
+        self.signatures = {}  # 路径 -> [曲目号, 大小, 修改时间]
+        self.pending = []  # 尚未合并的 (哈希, 曲目号, 时间)
+        self.dead = False  # 有已删除曲目的哈希尚未从有序数组中去掉
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def is_current(self, path: str) -> bool:
+        entry = self.signatures.get(path)
+        if entry is None:
+            return False
+        stat = os.stat(path)
+        return entry[1] == stat.st_size and entry[2] == stat.st_mtime
+
+    def add(self, path: str, hashes: np.ndarray, anchors: np.ndarray) -> int:
+        """
+        添加一首曲目的指纹
+        :param path: 文件路径
+        :param hashes: 哈希数组
+        :param anchors: 锚点帧号数组
+        :return: 曲目号
+        """
+        stat = os.stat(path)
+        trackId = len(self.paths)
+        self.paths.append(path)
+        self.counts.append(len(hashes))
+        self.signatures[path] = [trackId, stat.st_size, stat.st_mtime]
+        self.pending.append((hashes, np.full(len(hashes), trackId, dtype=np.uint32), anchors))
+        return trackId
+
+    def remove(self, path: str) -> None:
+        """
+        删除一首曲目，曲目号不再复用，其哈希在下次合并时去掉
+        :param path: 文件路径
+        :return: None
+        """
+        entry = self.signatures.pop(path, None)
+        if entry is None:
+            return
+        self.paths[entry[0]] = None
+        self.counts[entry[0]] = 0
+        self.dead = True
+
+    def merge(self) -> None:
+        """把新增指纹合并进有序数组，并去掉已删除曲目的哈希"""
+        if not self.pending and self.dead is False:
+            return
+        hashes = np.concatenate([self.hashes] + [item[0] for item in self.pending])
+        tracks = np.concatenate([self.tracks] + [item[1] for item in self.pending])
+        times = np.concatenate([self.times] + [item[2] for item in self.pending])
+        if self.dead:
+            alive = np.array([path is not None for path in self.paths], dtype=bool)
+            keep = alive[tracks]
+            hashes, tracks, times = hashes[keep], tracks[keep], times[keep]
+        order = np.argsort(hashes, kind="stable")
+        self.hashes, self.tracks, self.times = hashes[order], tracks[order], times[order]
+        self.pending = []
+        self.dead = False
+
+    def match(self, hashes: np.ndarray, anchors: np.ndarray) -> dict:
+        """
+        查找与给定指纹对齐命中的曲目
+        :param hashes: 查询哈希
+        :param anchors: 查询锚点帧号
+        :return: 曲目号 -> 命中比例
+        """
+        self.merge()
+        if len(hashes) == 0 or len(self.hashes) == 0:
+            return {}
+        low = np.searchsorted(self.hashes, hashes, side="left")
+        high = np.searchsorted(self.hashes, hashes, side="right")
+        sizes = high - low
+        if sizes.sum() == 0:
+            return {}
+        # 展开所有命中的区间
+        query = np.repeat(np.arange(len(hashes)), sizes)
+        starts = np.repeat(low - np.concatenate(([0], np.cumsum(sizes)[:-1])), sizes)
+        rows = starts + np.arange(sizes.sum())
+
+        tracks = self.tracks[rows].astype(np.int64)
+        deltas = self.times[rows].astype(np.int64) - anchors[query].astype(np.int64)
+        keys, votes = np.unique((tracks << 32) | (deltas & 0xFFFFFFFF), return_counts=True)
+        best = {}
+        for track, vote in zip((keys >> 32).tolist(), votes.tolist()):
+            if vote > best.get(track, 0):
+                best[track] = vote
+        return {
+            track: vote / max(min(len(hashes), self.counts[track]), 1)
+            for track, vote in best.items()
+        }
+
+    def duplicate_groups(self, threshold: float = MATCH_THRESHOLD) -> list:
+        """
+        用索引自身查询每首曲目，把互相命中的曲目合并为重复组
+        :param threshold: 命中比例阈值
+        :return: list[list[路径]]
+        """
+        self.merge()
+        parent = list(range(len(self.paths)))
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        order = np.argsort(self.tracks, kind="stable")
+        bounds = np.searchsorted(self.tracks[order], np.arange(len(self.paths) + 1))
+        for track, path in enumerate(self.paths):
+            if path is None:
+                continue
+            rows = order[bounds[track]:bounds[track + 1]]
+            for other, score in self.match(self.hashes[rows], self.times[rows]).items():
+                if other != track and score >= threshold and self.paths[other] is not None:
+                    parent[find(other)] = find(track)
+
+        groups = {}
+        for track, path in enumerate(self.paths):
+            if path is not None:
+                groups.setdefault(find(track), []).append(path)
+        return [sorted(group) for group in groups.values() if len(group) > 1]
+
+    def save(self, path: str = None) -> None:
+        self.merge()
+        path = path or fingerprint_index_path()
+        temp = path + ".tmp.npz"
+        np.savez(
+            temp,
+            hashes=self.hashes, tracks=self.tracks, times=self.times,
+            counts=np.array(self.counts, dtype=np.int64),
+            meta=np.array(json.dumps({"paths": self.paths, "signatures": self.signatures}, ensure_ascii=False)),
+        )
+        os.replace(temp, path)
+
+    @classmethod
+    def load(cls, path: str = None) -> "FingerprintIndex":
+        index = cls()
+        path = path or fingerprint_index_path()
+        if os.path.isfile(path) is False:
+            return index
+        try:
+            with np.load(path) as data:
+                index.hashes, index.tracks, index.times = data["hashes"], data["tracks"], data["times"]
+                index.counts = data["counts"].tolist()
+                meta = json.loads(str(data["meta"]))
+            index.paths, index.signatures = meta["paths"], meta["signatures"]
+            index.dead = None in index.paths
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"读取指纹索引失败: {e}")
+            return cls()
+        return index
+
+
+def fingerprint_index_path() -> str:
+    cache_dir = os.path.join(PATH, "cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, "Fingerprints.npz")
+
+
+def duplicate_groups_path() -> str:
+    cache_dir = os.path.join(PATH, "cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, "DuplicateGroups.json")
+
+
+def fingerprint_library(source: str, jobs: int = None, batch: int = 64) -> list:
+    """
+    分批并行计算曲库指纹，更新索引并写出重复组
+    :param source: 文件夹或播放列表
+    :param jobs: 进程数
+    :param batch: 每批提交的文件数
+    :return: 重复组
+    """
+    files, _ = collect_sources(source)
+    files = [os.path.abspath(file) for file in files]
+    index = FingerprintIndex.load()
+    # 文件已变化的曲目先删除，再重新计算
+    for file in files:
+        if file in index.signatures and index.is_current(file) is False:
+            index.remove(file)
+    # 已删除的文件，以及扫描的文件夹中不再存在的曲目
+    scanned = set(files)
+    prefix = os.path.join(os.path.abspath(source), "") if os.path.isdir(source) else None
+    for path in list(index.signatures):
+        if path not in scanned and (os.path.isfile(path) is False or (prefix and path.startswith(prefix))):
+            index.remove(path)
+    todo = [file for file in files if file not in index.signatures]
+
+    logger.info(f"计算指纹：{len(todo)}首，已有{len(index)}首")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+        for offset in range(0, len(todo), batch):
+            for path, hashes, anchors in executor.map(fingerprint_file, todo[offset:offset + batch]):
+                if hashes is not None:
+                    index.add(path, hashes, anchors)
+    # 每次保存都要重新排序整个哈希数组，全部计算完后只合并、保存一次
+    index.save()
+    logger.info(f"指纹计算完成，用时{time.perf_counter() - start:.2f}s")
+
+    groups = index.duplicate_groups()
+    canonical = {path: group[0] for group in groups for path in group}
+    with open(duplicate_groups_path(), mode="w+", encoding="utf-8") as wfp:
+        wfp.write(json.dumps(canonical, indent=4, ensure_ascii=False))
+    logger.info(f"发现{len(groups)}组重复曲目")
+    return groups
+
+
+def duplicate_canonical(music_file: str) -> str or None:
+    """
+    返回重复组中的代表文件（绝对路径，代表文件本身也返回自身），不在任何重复组中时返回None
+    :param music_file: 文件路径
+    :return: str or None
+    """
+    path = duplicate_groups_path()
+    if os.path.isfile(path) is False:
+        return None
+    with open(path, mode="r", encoding="utf-8") as rfp:
+        canonical = json.loads(rfp.read())
+    return canonical.get(os.path.abspath(music_file))
+
+
+def canonical_file(music_file: str) -> str:
+    """
+    返回重复组中的代表文件，不在任何重复组中时返回自身
+    :param music_file: 文件路径
+    :return: str
+    """
+    return duplicate_canonical(music_file) or music_file
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="计算曲库指纹并查找重复曲目")
+    parser.add_argument("source", help="文件夹或m3u播放列表")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="进程数，默认为CPU核心数")
+    args = parser.parse_args(argv)
+
+    for group in fingerprint_library(args.source, args.jobs):
+        print("\n".join(group), end="\n\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,393 @@
+import os
+import re
+import sys
+import json
+import time
+import pickle
+import argparse
+import subprocess
+import unicodedata
+from array import array
+import numpy as np
+from loguru import logger
+from Transcoder import collect_sources
+from MediaTools import MediaToolService, media_tools
+from TrackModel import TrackTable
+
+PATH = os.path.split(__file__)[0]
+
+INDEX_VERSION = 2
+METADATA_ENTRIES = "format=duration:format_tags=title,artist,album,replaygain_track_gain:stream=sample_rate"
+FIELDS = ("title", "artist", "album", "filename")
+FIELD_WEIGHTS = np.array([3.0, 2.0, 1.5, 1.0], dtype=np.float32)  # 与FIELDS顺序一致
+MAX_PREFIX = 12  # 拉丁词最多索引的前缀长度
+# 连续的拉丁字母/数字组成一个词；中日韩字符逐字切分
+CJK_RANGES = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+TOKEN_PATTERN = re.compile(f"[0-9a-z\u00c0-\u024f]+|[{CJK_RANGES}]+")
+CJK_PATTERN = re.compile(f"[{CJK_RANGES}]")
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").casefold()
+
+
+def index_grams(text: str) -> set:
+    """
+    生成索引用的词项：拉丁词的所有前缀，中日韩文字的单字与相邻双字
+    :param text: 字段文本
+    :return: set
+    """
+    grams = set()
+    for token in TOKEN_PATTERN.findall(normalize(text)):
+        if CJK_PATTERN.match(token):
+            grams.update(token)
+            grams.update(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            grams.update(token[:i] for i in range(1, min(len(token), MAX_PREFIX) + 1))
+    return grams
+
+
+def query_grams(text: str) -> list:
+    """
+    生成查询词项，所有词项都需要命中
+    :param text: 查询文本
+    :return: list
+    """
+    grams = []
+    for token in TOKEN_PATTERN.findall(normalize(text)):
+        if CJK_PATTERN.match(token) and len(token) > 1:
+            grams.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            grams.append(token[:MAX_PREFIX])
+    return list(dict.fromkeys(grams))
+
+
+class SearchIndex:
+    """
+    曲库元数据的内存倒排索引
+    倒排表元素为 文档号 * 4 + 字段号，按文档号递增排列。
+    已保存的倒排表合并为一个 uint32 数组（frozenData + frozenOffsets），
+    之后新增的文档先追加到 extra 中的 array('I')，保存时再合并；
+    删除（包括修改后重新添加）的文档只做标记，合并时才从倒排表和曲目表中去掉，
+    剩余文档按原顺序重新编号，不再被任何文档使用的词项也一并去掉。
+    文档号即曲目表 tracks 的行号。
+    """
+    def __init__(self):
+        self.grams = {}  # 词项 -> 词项号
+        self.frozenOffsets = np.zeros(1, dtype=np.int64)
+        self.frozenData = np.zeros(0, dtype=np.uint32)
+        self.extra = {}  # 词项号 -> array('I')
+        self.tracks = TrackTable()
+        self.docIds = {}  # 路径 -> 文档号，不做序列化
+
+    def __len__(self) -> int:
+        return len(self.docIds)
+
+    def add(self, path: str, metadata: dict) -> None:
+        """
+        添加或更新一首曲目，大小和修改时间未变化时跳过
+        :param path: 文件路径
+        :param metadata: 元数据，包含 title/artist/album/size/mtime
+        :return: None
+        """
+        size, mtime = metadata.get("size") or 0, metadata.get("mtime") or 0.0
+        docId = self.docIds.get(path)
+        if docId is not None:
+            if self.tracks.sizes[docId] == size and self.tracks.mtimes[docId] == mtime:
+                return
+            self.remove(path)
+
+        docId = self.tracks.append(path, metadata)
+        filename = os.path.splitext(os.path.basename(path))[0]
+        self.docIds[path] = docId
+
+        values = (metadata.get("title"), metadata.get("artist"), metadata.get("album"), filename)
+        for field, value in enumerate(values):
+            for gram in index_grams(value):
+                termId = self.grams.setdefault(gram, len(self.grams))
+                posting = self.extra.get(termId)
+                if posting is None:
+                    posting = self.extra[termId] = array("I")
+                posting.append(docId * 4 + field)
+
+    def remove(self, path: str) -> None:
+        docId = self.docIds.pop(path, None)
+        if docId is None:
+            return
+        self.tracks.remove(docId)
+
+    def update(self, metadata: dict) -> bool:
+        """
+        根据元数据缓存增量更新索引
+        :param metadata: 路径 -> 元数据
+        :return: 索引是否有变化
+        """
+        before = len(self.tracks)
+        removed = [path for path in self.docIds if path not in metadata]
+        for path in removed:
+            self.remove(path)
+        for path, value in metadata.items():
+            self.add(path, value)
+        return bool(removed) or len(self.tracks) != before
+
+    def posting(self, gram: str) -> np.ndarray:
+        termId = self.grams.get(gram)
+        if termId is None:
+            return np.zeros(0, dtype=np.uint32)
+        parts = []
+        if termId + 1 < len(self.frozenOffsets):
+            parts.append(self.frozenData[self.frozenOffsets[termId]:self.frozenOffsets[termId + 1]])
+        if termId in self.extra:
+            parts.append(np.frombuffer(self.extra[termId], dtype=np.uint32))
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint32)
+
+    def term_scores(self, gram: str) -> tuple:
+        """
+        单个词项命中的文档及其最高字段权重
+        :param gram: 词项
+        :return: (递增的文档号数组, 分数数组)
+        """
+        entries = self.posting(gram)
+        if len(entries) == 0:
+            return entries, np.zeros(0, dtype=np.float32)
+        docs = entries >> 2
+        first = np.flatnonzero(np.concatenate(([True], docs[1:] != docs[:-1])))
+        # 同一文档多个字段命中时取权重最高的字段
+        return docs[first], np.maximum.reduceat(FIELD_WEIGHTS[entries & 3], first)
+
+    def search(self, text: str, limit: int = 20) -> list:
+        """
+        查询曲目，结果按字段权重排序
+        :param text: 查询文本
+        :param limit: 返回数量
+        :return: list[(路径, 显示名称, 分数)]
+        """
+        grams = []
+        for gram in query_grams(text):
+            if len(gram) == 2 and CJK_PATTERN.match(gram) and len(self.posting(gram)) == 0:
+                # 跨字段连写的双字（如"周杰伦晴天"中的"伦晴"）没有倒排表，改为分别要求两个单字
+                grams.extend(gram)
+            else:
+                grams.append(gram)
+        grams = list(dict.fromkeys(grams))
+        if not grams:
+            return []
+        # 从最短的倒排表开始求交集
+        postings = sorted((self.term_scores(gram) for gram in grams), key=lambda item: len(item[0]))
+        docs, scores = postings[0]
+        for termDocs, termScores in postings[1:]:
+            if len(docs) == 0 or len(termDocs) == 0:
+                return []
+            position = np.minimum(np.searchsorted(termDocs, docs), len(termDocs) - 1)
+            match = termDocs[position] == docs
+            docs, scores = docs[match], scores[match] + termScores[position[match]]
+
+        mask = self.tracks.column("alive")[docs] == 1
+        docs, scores = docs[mask], scores[mask]
+        if len(docs) > limit:
+            top = np.argpartition(-scores, limit)[:limit]
+            docs, scores = docs[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        paths, titles = self.tracks.paths, self.tracks.titles
+        return [(paths[docs[index]], titles[docs[index]], float(scores[index])) for index in order]
+
+    def compact(self) -> None:
+        """把新增的倒排表合并进 frozenData，去掉已删除的文档与空词项并重新编号"""
+        parts = []
+        for termId in range(len(self.grams)):
+            if termId + 1 < len(self.frozenOffsets):
+                parts.append(self.frozenData[self.frozenOffsets[termId]:self.frozenOffsets[termId + 1]])
+            else:
+                parts.append(np.zeros(0, dtype=np.uint32))
+            if termId in self.extra:
+                parts[-1] = np.concatenate((parts[-1], np.frombuffer(self.extra[termId], dtype=np.uint32)))
+        lengths = np.array([len(part) for part in parts], dtype=np.int64)
+        data = np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint32)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+        keep = self.tracks.column("alive")[data >> 2] == 1
+        kept = np.concatenate(([0], np.cumsum(keep)))
+        data, offsets = data[keep], kept[offsets]
+        # 新文档号保持原有顺序，倒排表仍然递增
+        mapping = self.tracks.compact()
+        data = (mapping[data >> 2] << 2 | (data & 3)).astype(np.uint32)
+
+        used = np.diff(offsets) > 0
+        self.grams = {gram: termId for termId, gram in enumerate(
+            gram for gram, termId in self.grams.items() if used[termId]
+        )}
+        self.frozenData = data
+        self.frozenOffsets = np.concatenate(([0], offsets[1:][used]))
+        self.extra = {}
+        self.docIds = {path: docId for docId, path in enumerate(self.tracks.paths)}
+
+    def save(self, path: str = None) -> None:
+        self.compact()
+        path = path or search_index_path()
+        state = {key: value for key, value in self.__dict__.items() if key not in ("grams", "docIds")}
+        state["grams"] = list(self.grams)
+        temp = path + ".tmp"
+        with open(temp, "wb") as wfp:
+            pickle.dump((INDEX_VERSION, state), wfp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, path)
+        logger.info(f"保存曲库搜索索引：{len(self)}首")
+
+    @classmethod
+    def load(cls, path: str = None) -> "SearchIndex":
+        """
+        读取序列化的索引，不存在或版本不一致时返回空索引
+        :param path: 索引文件路径
+        :return: SearchIndex
+        """
+        index = cls()
+        path = path or search_index_path()
+        if os.path.isfile(path) is False:
+            return index
+        try:
+            with open(path, "rb") as rfp:
+                version, state = pickle.load(rfp)
+            if version == INDEX_VERSION:
+                state["grams"] = dict(zip(state["grams"], range(len(state["grams"]))))
+                index.__dict__.update(state)
+                index.docIds = {path: docId for docId, path in enumerate(index.tracks.paths) if path is not None}
+        except (OSError, pickle.UnpicklingError, ValueError, EOFError, KeyError) as e:
+            logger.error(f"读取曲库搜索索引失败: {e}")
+        return index
+
+
+def search_index_path() -> str:
+    cache_dir = os.path.join(PATH, "cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, "LibrarySearchIndex.pkl")
+
+
+def metadata_cache_path() -> str:
+    cache_dir = os.path.join(PATH, "cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, "MusicMetadataCache.json")
+
+
+def load_metadata_cache() -> dict:
+    path = metadata_cache_path()
+    if os.path.isfile(path) is False:
+        return {}
+    with open(path, mode="r", encoding="utf-8") as rfp:
+        return json.loads(rfp.read())
+
+
+def save_metadata_cache(metadata: dict) -> None:
+    path = metadata_cache_path()
+    with open(path + ".tmp", mode="w+", encoding="utf-8") as wfp:
+        wfp.write(json.dumps(metadata, ensure_ascii=False))
+    os.replace(path + ".tmp", path)
+
+
+def parse_metadata(music_file: str, output: dict or None) -> dict:
+    """
+    从ffprobe的json输出中取出标题、艺术家、专辑、时长、采样率和回放增益
+    :param music_file: 文件路径
+    :param output: ffprobe 的json输出，探测失败时为None
+    :return: dict
+    """
+    stat = os.stat(music_file)
+    result = {"size": stat.st_size, "mtime": stat.st_mtime}
+    if output is None:
+        return result
+    info = output.get("format", {})
+    tags = {key.lower(): value for key, value in info.get("tags", {}).items()}
+    try:
+        duration = float(info.get("duration", 0) or 0)
+    except ValueError:
+        duration = 0.0
+    try:
+        # 形如 "-6.54 dB"
+        gain = float(str(tags.get("replaygain_track_gain") or 0).split()[0])
+    except (ValueError, IndexError):
+        gain = 0.0
+    sampleRates = [stream.get("sample_rate") for stream in output.get("streams", []) if stream.get("sample_rate")]
+    result.update(
+        title=tags.get("title"), artist=tags.get("artist"), album=tags.get("album"), duration=duration,
+        sampleRate=int(sampleRates[0]) if sampleRates else 0, gain=gain
+    )
+    return result
+
+
+def read_metadata(music_file: str) -> dict:
+    """
+    使用ffprobe读取标题、艺术家、专辑、时长、采样率和回放增益
+    :param music_file: 文件路径
+    :return: dict
+    """
+    try:
+        output = media_tools().probe(music_file, METADATA_ENTRIES)
+    except (subprocess.SubprocessError, ValueError, OSError) as e:
+        logger.error(f"读取{music_file}元数据失败: {e}")
+        output = None
+    return parse_metadata(music_file, output)
+
+
+def scan_library(folder: str, jobs: int = None) -> dict:
+    """
+    扫描文件夹，只为新增或修改过的文件读取元数据，并更新元数据缓存
+    :param folder: 曲库文件夹
+    :param jobs: 并行数
+    :return: 路径 -> 元数据
+    """
+    files, _ = collect_sources(folder)
+    files = [os.path.abspath(file) for file in files]
+    cached = load_metadata_cache()
+    prefix = os.path.join(os.path.abspath(folder), "")  # 以分隔符结尾，避免匹配到同名前缀的兄弟文件夹
+    metadata = {path: value for path, value in cached.items() if not path.startswith(prefix)}
+
+    changed = []
+    for file in files:
+        stat = os.stat(file)
+        value = cached.get(file)
+        if value and value.get("size") == stat.st_size and value.get("mtime") == stat.st_mtime:
+            metadata[file] = value
+        else:
+            changed.append(file)
+
+    logger.info(f"扫描曲库：{len(files)}首，需要读取元数据{len(changed)}首")
+    service = MediaToolService(jobs) if jobs else media_tools()
+    for file, output in service.probe_inputs(changed, METADATA_ENTRIES).items():
+        metadata[file] = parse_metadata(file, output)
+    if service is not media_tools():
+        service.shutdown()
+    save_metadata_cache(metadata)
+    return metadata
+
+
+def load_search_index() -> SearchIndex:
+    """
+    读取序列化的索引并用元数据缓存增量更新
+    :return: SearchIndex
+    """
+    index = SearchIndex.load()
+    if index.update(load_metadata_cache()):
+        index.save()
+    return index
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="曲库搜索")
+    parser.add_argument("query", help="查询文本")
+    parser.add_argument("--scan", default=None, help="先扫描该文件夹并更新索引")
+    parser.add_argument("-n", "--limit", type=int, default=20, help="返回数量")
+    args = parser.parse_args(argv)
+
+    if args.scan:
+        scan_library(args.scan)
+    index = load_search_index()
+    start = time.perf_counter()
+    results = index.search(args.query, args.limit)
+    logger.info(f"查询用时{(time.perf_counter() - start) * 1000:.2f}ms")
+    for path, title, score in results:
+        print(f"{score:5.1f}  {title}  {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
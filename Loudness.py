@@ -0,0 +1,82 @@
+import os
+import json
+import numpy as np
+from loguru import logger
+from PcmCache import load_pcm, track_cache_key
+
+PATH = os.path.split(__file__)[0]
+
+LOUDNESS_VERSION = 1
+BLOCK_SECONDS = 0.4  # 门限测量块长度
+ABSOLUTE_GATE = -70.0  # dBFS
+RELATIVE_GATE = -10.0  # 相对未加相对门限的平均响度
+TARGET_LOUDNESS = -18.0  # 回放增益的参考响度
+CHUNK_BLOCKS = 4096  # 每次处理的块数，限制临时内存
+
+
+def measure_loudness(samples: np.ndarray, sampleRate: int) -> float:
+    """
+    分块均方功率加绝对、相对两级门限的整体响度（未做K加权的简化版 BS.1770）
+    :param samples: int16 单声道采样
+    :param sampleRate: 采样率
+    :return: dBFS，静音时为 -inf
+    """
+    block = int(BLOCK_SECONDS * sampleRate)
+    count = len(samples) // block
+    if count == 0:
+        return float("-inf")
+    power = np.empty(count, dtype=np.float64)
+    for start in range(0, count, CHUNK_BLOCKS):
+        end = min(start + CHUNK_BLOCKS, count)
+        chunk = np.asarray(samples[start * block:end * block], dtype=np.float32) / 32768
+        power[start:end] = np.square(chunk.reshape(end - start, block)).mean(axis=1)
+
+    with np.errstate(divide="ignore"):
+        levels = 10 * np.log10(power)
+    gated = power[levels > ABSOLUTE_GATE]
+    if len(gated) == 0:
+        return float("-inf")
+    relative = 10 * np.log10(gated.mean()) + RELATIVE_GATE
+    gated = power[levels > max(ABSOLUTE_GATE, relative)]
+    return float(10 * np.log10(gated.mean()))
+
+
+def loudness_cache_path(music_file: str) -> str:
+    cache_dir = os.path.join(PATH, "cache", "loudness")
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, track_cache_key(music_file) + ".json")
+
+
+def get_loudness(music_file: str) -> dict or None:
+    """
+    获取曲目的响度与建议的回放增益，缓存失效时才重新测量
+    :param music_file: 音乐文件路径
+    :return: {"loudness": dBFS, "gain": dB} or None
+    """
+    path = loudness_cache_path(music_file)
+    try:
+        stat = os.stat(music_file)
+    except OSError as e:
+        logger.error(f"获取响度失败: {e}")
+        return None
+
+    if os.path.isfile(path):
+        try:
+            with open(path, mode="r", encoding="utf-8") as rfp:
+                cached = json.loads(rfp.read())
+            if cached.get("version") == LOUDNESS_VERSION and cached.get("size") == stat.st_size \
+                    and cached.get("mtime") == stat.st_mtime:
+                return {"loudness": cached["loudness"], "gain": cached["gain"]}
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"读取响度缓存失败: {e}")
+
+    logger.info(f"测量{music_file}的响度")
+    samples, sampleRate = load_pcm(music_file)
+    loudness = measure_loudness(samples, sampleRate)
+    gain = TARGET_LOUDNESS - loudness if np.isfinite(loudness) else 0.0
+    result = {"loudness": loudness if np.isfinite(loudness) else None, "gain": gain}
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, mode="w+", encoding="utf-8") as wfp:
+        wfp.write(json.dumps(dict(result, version=LOUDNESS_VERSION, size=stat.st_size, mtime=stat.st_mtime)))
+    os.replace(temp, path)
+    return result
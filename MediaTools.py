@@ -0,0 +1,344 @@
+import os
+import re
+import sys
+import json
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError
+from loguru import logger
+
+PATH = os.path.split(__file__)[0]
+
+TOOLS = ("ffmpeg", "ffprobe", "ffplay")
+BUNDLED_DIR = os.path.join(PATH, "FFmpeg")  # 随程序附带的FFmpeg目录
+DIR_ENV = "PYFUSION_FFMPEG_DIR"  # 配置：FFmpeg所在目录
+DEFAULT_TIMEOUT = 60
+PROBE_BATCH = 32  # 一次ffmpeg调用探测的文件数
+INPUT_PATTERN = re.compile(r"^Input #(\d+),")
+DURATION_PATTERN = re.compile(r"^\s+Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+TAG_PATTERN = re.compile(r"^    (\S[^:]*?)\s*: (.*)$")  # 输入级 Metadata 下缩进4格的标签
+SAMPLE_RATE_PATTERN = re.compile(r"^\s+Stream #\d+:\d+.*: Audio: .*?(\d+) Hz")
+
+_tool_paths = {}
+_tool_lock = threading.Lock()
+
+
+def tool_path(name: str) -> str:
+    """
+    查找FFmpeg工具，只在第一次调用时搜索。
+    顺序：环境变量（如 FFMPEG=/path/to/ffmpeg）、PYFUSION_FFMPEG_DIR 目录、PATH、附带的FFmpeg目录
+    :param name: ffmpeg / ffprobe / ffplay
+    :return: 可执行文件路径
+    """
+    with _tool_lock:
+        if name in _tool_paths:
+            return _tool_paths[name]
+
+        executable = name + (".exe" if sys.platform == "win32" else "")
+        candidates = [os.environ.get(name.upper())]
+        if os.environ.get(DIR_ENV):
+            candidates.append(os.path.join(os.environ[DIR_ENV], executable))
+        candidates.append(shutil.which(name))
+        candidates.append(os.path.join(BUNDLED_DIR, executable))
+
+        for candidate in candidates:
+            if candidate and os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+                logger.info(f"使用{name}：{candidate}")
+                _tool_paths[name] = candidate
+                return candidate
+    raise FileNotFoundError(f"找不到{name}，请安装FFmpeg或设置环境变量{DIR_ENV}")
+
+
+class MediaJob:
+    """提交到MediaToolService的一次工具调用，可取消"""
+    def __init__(self, tool: str, args: list, timeout: float = None, text: bool = True):
+        self.cmd = [tool_path(tool)] + [str(arg) for arg in args]
+        self.timeout = timeout
+        self.text = text
+        self.process = None
+        self.cancelled = False
+        self.future = Future()
+        self.lock = threading.Lock()
+
+    def run(self) -> None:
+        if self.future.set_running_or_notify_cancel() is False:
+            return
+        try:
+            with self.lock:
+                if self.cancelled:
+                    raise subprocess.SubprocessError("任务已取消")
+                self.process = subprocess.Popen(
+                    self.cmd,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    universal_newlines=self.text,
+                    encoding="utf-8" if self.text else None,
+                    errors="replace" if self.text else None,
+                )
+            try:
+                stdout, stderr = self.process.communicate(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.communicate()
+                raise
+            if self.cancelled:
+                raise subprocess.SubprocessError("任务已取消")
+            self.future.set_result(subprocess.CompletedProcess(self.cmd, self.process.returncode, stdout, stderr))
+        except BaseException as e:
+            self.future.set_exception(e)
+
+    def cancel(self) -> None:
+        """取消任务，正在运行时结束进程"""
+        with self.lock:
+            self.cancelled = True
+            self.future.cancel()
+            if self.process is not None and self.process.poll() is None:
+                self.process.kill()
+
+
+class MediaToolService:
+    """
+    FFmpeg工具服务：所有探测、提取、转换任务经过同一个有界并发队列，
+    超出队列长度时提交方会等待，避免一次批量操作同时拉起成百上千个进程
+    """
+    def __init__(self, workers: int = None, queueSize: int = None):
+        """
+        :param workers: 同时运行的进程数，默认为CPU核心数
+        :param queueSize: 排队任务上限，默认为workers的4倍
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="MediaTool")
+        self.slots = threading.BoundedSemaphore(queueSize or self.workers * 4)
+        self.jobs = set()  # 未完成的任务，关闭时逐个取消
+        self.lock = threading.Lock()
+
+    def submit(self, tool: str, args: list, timeout: float = DEFAULT_TIMEOUT, text: bool = True) -> MediaJob:
+        """
+        提交一次工具调用
+        :param tool: ffmpeg / ffprobe / ffplay
+        :param args: 参数
+        :param timeout: 超时时间（秒），None为不限
+        :param text: 输出是否按文本解码
+        :return: MediaJob，结果在 job.future 中为 CompletedProcess
+        """
+        job = MediaJob(tool, args, timeout, text)
+        self.slots.acquire()
+        with self.lock:
+            self.jobs.add(job)
+        job.future.add_done_callback(lambda _: self._finished(job))
+        try:
+            self.executor.submit(job.run)
+        except RuntimeError:
+            # 已关闭
+            job.cancel()
+            raise
+        return job
+
+    def _finished(self, job: MediaJob) -> None:
+        with self.lock:
+            self.jobs.discard(job)
+        self.slots.release()
+
+    def run(self, tool: str, args: list, timeout: float = DEFAULT_TIMEOUT, check: bool = True,
+            text: bool = True) -> subprocess.CompletedProcess:
+        """
+        同步运行一次工具调用
+        :param tool: ffmpeg / ffprobe / ffplay
+        :param args: 参数
+        :param timeout: 超时时间（秒）
+        :param check: 返回码非0时抛出CalledProcessError
+        :param text: 输出是否按文本解码
+        :return: CompletedProcess
+        """
+        result = self.submit(tool, args, timeout, text).future.result()
+        if check and result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+        return result
+
+    def probe(self, music_file: str, entries: str = "format=duration", timeout: float = DEFAULT_TIMEOUT) -> dict:
+        """
+        使用ffprobe读取信息
+        :param music_file: 文件路径
+        :param entries: -show_entries 参数
+        :param timeout: 超时时间（秒）
+        :return: ffprobe 的json输出
+        """
+        result = self.run("ffprobe", [
+            "-v", "error", "-show_entries", entries, "-of", "json", music_file
+        ], timeout)
+        return json.loads(result.stdout)
+
+    def probe_many(self, files: list, entries: str = "format=duration", timeout: float = DEFAULT_TIMEOUT) -> dict:
+        """
+        并发探测多个文件，ffprobe每次只接受一个输入，因此逐个提交到队列
+        :param files: 文件列表
+        :param entries: -show_entries 参数
+        :param timeout: 超时时间（秒）
+        :return: 文件 -> json输出，失败时为None
+        """
+        jobs = [(file, self.submit("ffprobe", [
+            "-v", "error", "-show_entries", entries, "-of", "json", file
+        ], timeout)) for file in files]
+        result = {}
+        for file, job in jobs:
+            try:
+                completed = job.future.result()
+                result[file] = json.loads(completed.stdout) if completed.returncode == 0 else None
+            except (subprocess.SubprocessError, ValueError, OSError, CancelledError) as e:
+                logger.error(f"探测{file}失败: {e}")
+                result[file] = None
+        return result
+
+    def probe_inputs(self, files: list, entries: str = "format=duration", timeout: float = DEFAULT_TIMEOUT) -> dict:
+        """
+        批量探测：一次ffmpeg调用带多个 -i 输入，从输入信息中解析时长、标签与采样率，
+        整理成与 ffprobe -of json 相同的结构；
+        解析不到的文件（如某个输入无法打开导致提前退出）再单独用ffprobe探测
+        :param files: 文件列表
+        :param entries: 单独探测时的 -show_entries 参数
+        :param timeout: 超时时间（秒）
+        :return: 文件 -> {"format": {"duration", "tags"}, "streams": [{"sample_rate"}]}，失败时为None
+        """
+        batches = []
+        for offset in range(0, len(files), PROBE_BATCH):
+            batch = files[offset:offset + PROBE_BATCH]
+            args = ["-hide_banner", "-nostdin"]
+            for file in batch:
+                args += ["-i", file]
+            batches.append((batch, self.submit("ffmpeg", args, timeout)))
+
+        result = {}
+        missing = []
+        for batch, job in batches:
+            inputs = {}
+            try:
+                current = None
+                inTags = False
+                for line in job.future.result().stderr.splitlines():
+                    match = INPUT_PATTERN.match(line)
+                    if match:
+                        current = inputs[int(match.group(1))] = {"format": {"tags": {}}, "streams": []}
+                        inTags = False
+                        continue
+                    if current is None:
+                        continue
+                    if line == "  Metadata:":
+                        inTags = True
+                        continue
+                    match = TAG_PATTERN.match(line)
+                    if inTags and match:
+                        current["format"]["tags"].setdefault(match.group(1), match.group(2))
+                        continue
+                    inTags = False
+                    match = DURATION_PATTERN.match(line)
+                    if match:
+                        hours, minutes, seconds = match.groups()
+                        current["format"]["duration"] = str(int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+                        continue
+                    match = SAMPLE_RATE_PATTERN.match(line)
+                    if match:
+                        current["streams"].append({"sample_rate": match.group(1)})
+            except (subprocess.SubprocessError, OSError, CancelledError) as e:
+                logger.error(f"批量探测失败: {e}")
+            for index, file in enumerate(batch):
+                if "duration" in inputs.get(index, {}).get("format", {}):
+                    result[file] = inputs[index]
+                else:
+                    missing.append(file)
+
+        result.update(self.probe_many(missing, entries, timeout))
+        return result
+
+    def probe_durations(self, files: list, timeout: float = DEFAULT_TIMEOUT) -> dict:
+        """
+        批量获取时长，见 probe_inputs
+        :param files: 文件列表
+        :param timeout: 超时时间（秒）
+        :return: 文件 -> 时长（秒），失败时为None
+        """
+        result = {}
+        for file, info in self.probe_inputs(files, "format=duration", timeout).items():
+            try:
+                result[file] = float(info["format"]["duration"])
+            except (TypeError, KeyError, ValueError):
+                result[file] = None
+        return result
+
+    def extract_cover(self, music_file: str, output_file: str, timeout: float = DEFAULT_TIMEOUT) -> bool:
+        """
+        提取内嵌封面
+        :param music_file: 音乐文件路径
+        :param output_file: 封面输出路径
+        :param timeout: 超时时间（秒）
+        :return: bool
+        """
+        result = self.run("ffmpeg", [
+            "-v", "error", "-nostdin", "-y", "-i", music_file, "-an", "-vcodec", "copy", output_file
+        ], timeout, check=False)
+        return result.returncode == 0 and os.path.exists(output_file)
+
+    def shutdown(self, cancel: bool = True) -> None:
+        """
+        关闭服务，不等待运行中的进程
+        :param cancel: 取消排队中的任务。executor 的 cancel_futures 只取消包装 job.run 的Future，
+                       job.future 不会完成，等待方会一直阻塞、队列名额也不会释放，因此逐个取消任务本身
+        :return: None
+        """
+        if cancel:
+            with self.lock:
+                pending = [job for job in self.jobs if job.future.running() is False]
+            for job in pending:
+                job.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=cancel)
+
+
+_service = None
+
+
+def media_tools() -> MediaToolService:
+    """获取全局的MediaToolService"""
+    global _service
+    with _tool_lock:
+        if _service is None:
+            _service = MediaToolService()
+        return _service
+
+
+def get_music_cover(music_file) -> str or None:
+    cache_dir = "./cache"
+    os.makedirs(cache_dir, exist_ok=True)  # 创建缓存目录
+
+    output_file = os.path.join(cache_dir, os.path.basename(music_file).replace(".", "_") + "_cover.jpg")  # 生成保存路径
+    if os.path.isfile(output_file) is True:
+        return output_file
+
+    try:
+        if media_tools().extract_cover(music_file, output_file):
+            return output_file
+        else:
+            return None
+    except Exception as e:
+        logger.error(f"获取封面错误: {e}")
+        return None
+
+
+def get_audio_duration(audio_file_path: str) -> int:
+    """
+    获取音频文件的总长度，与批量探测共用 probe_durations，解析失败时才退回ffprobe
+    :param audio_file_path: 文件路径
+    :return: int
+    """
+    logger.info(f"获取{audio_file_path}的总时长")
+    try:
+        duration = media_tools().probe_durations([audio_file_path]).get(audio_file_path)
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.error(f"获取时长失败: {e}")
+        duration = None
+    if duration is None:
+        return 100
+    # 取整
+    result = int(duration)
+    logger.info(f"获取到长度：{result}")
+    return result
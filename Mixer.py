@@ -0,0 +1,334 @@
+import os
+import sys
+import wave
+import argparse
+import subprocess
+import numpy as np
+from loguru import logger
+from MediaTools import tool_path, media_tools
+from PcmCache import open_pcm, pcm_cache_path
+
+BLOCK_FRAMES = 4096  # 每次混音的帧数
+CURVES = ("linear", "equal_power", "s_curve")
+
+
+def fade_curves(curve: str, count: int) -> tuple:
+    """
+    生成淡出、淡入增益曲线
+    :param curve: linear 线性 / equal_power 等功率 / s_curve 平滑S形
+    :param count: 帧数
+    :return: (淡出增益, 淡入增益)，均为float32
+    """
+    t = np.arange(count, dtype=np.float32) / max(count, 1)
+    if curve == "linear":
+        fadeIn = t
+    elif curve == "equal_power":
+        # 不相关的两路信号响度保持不变
+        return np.cos(t * np.pi / 2).astype(np.float32), np.sin(t * np.pi / 2).astype(np.float32)
+    elif curve == "s_curve":
+        fadeIn = (0.5 - 0.5 * np.cos(t * np.pi)).astype(np.float32)
+    else:
+        raise ValueError(f"未知的淡入淡出曲线：{curve}")
+    return 1 - fadeIn, fadeIn
+
+
+class ArraySource:
+    """内存中的采样作为音源，用于离线测试"""
+    def __init__(self, samples: np.ndarray):
+        """
+        :param samples: (帧数, 声道数) 的int16或float采样
+        """
+        if samples.dtype == np.int16:
+            samples = samples.astype(np.float32) / 32768
+        self.samples = samples.reshape(len(samples), -1).astype(np.float32, copy=False)
+        self.position = 0
+
+    def read(self, frames: int) -> np.ndarray:
+        block = self.samples[self.position:self.position + frames]
+        self.position += len(block)
+        return block
+
+    def close(self) -> None:
+        pass
+
+
+class DecoderSource:
+    """ffmpeg流式解码的音源，按块读取，不在内存中保留整首歌"""
+    def __init__(self, music_file: str, sampleRate: int = 44100, channels: int = 2, start_time: float = 0):
+        """
+        :param music_file: 音乐文件路径
+        :param sampleRate: 输出采样率
+        :param channels: 输出声道数
+        :param start_time: 开始解码的秒数
+        """
+        self.music_file = music_file
+        self.channels = channels
+        self.process = subprocess.Popen([
+            tool_path("ffmpeg"),
+            "-v", "error", "-nostdin",
+            "-ss", str(start_time),
+            "-i", music_file,
+            "-vn", "-f", "s16le", "-acodec", "pcm_s16le",
+            "-ar", str(sampleRate), "-ac", str(channels),
+            "-",
+        ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def read(self, frames: int) -> np.ndarray:
+        """
+        读取最多frames帧，返回帧数不足说明已到结尾
+        :param frames: 帧数
+        :return: (帧数, 声道数) 的float32
+        """
+        size = frames * self.channels * 2
+        chunks = []
+        while size > 0:
+            chunk = self.process.stdout.read(size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        data = b"".join(chunks)
+        data = data[:len(data) - len(data) % (self.channels * 2)]
+        return np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels).astype(np.float32) / 32768
+
+    def close(self) -> None:
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process.stdout.close()
+
+
+class Mixer:
+    """
+    两路音源的混音器：当前曲目与下一首。
+    淡入淡出的切换点按曲目已知时长换算为采样偏移：当前曲目第 (时长帧数 - 淡变帧数) 帧起两路按曲线叠加，
+    淡变结束时下一首成为当前曲目，时长应取解码后的采样数（见 decoded_durations），
+    ffprobe 的时长只精确到10毫秒，偏短时会截掉结尾。
+    淡变时长为0（无缝衔接）、时长未知或音源提前结束时，不按时长截断，在当前曲目最后一帧之后直接接上下一首。
+    """
+    def __init__(self, sampleRate: int = 44100, channels: int = 2, crossfade: float = 0.0,
+                 curve: str = "equal_power"):
+        """
+        :param sampleRate: 采样率
+        :param channels: 声道数
+        :param crossfade: 淡入淡出时长（秒）
+        :param curve: 淡入淡出曲线，见 CURVES
+        """
+        fade_curves(curve, 0)
+        self.sampleRate = sampleRate
+        self.channels = channels
+        self.crossfade = crossfade
+        self.curve = curve
+        self.current = None
+        self.currentEnd = None  # 当前曲目的结束帧，未知时为None
+        self.position = 0  # 当前曲目已输出的帧数
+        self.next = None
+        self.nextEnd = None
+        self.nextPosition = 0
+        self.fadeStart = None  # 当前曲目中开始淡变的帧
+        self.fadeOut = self.fadeIn = np.zeros(0, dtype=np.float32)
+        self.played = 0  # 已输出的总帧数
+        self.transitions = []  # 每首下一曲开始的总帧偏移
+
+    def frames(self, duration: float or None) -> int or None:
+        return int(round(duration * self.sampleRate)) if duration else None
+
+    def play(self, source, duration: float = None) -> None:
+        """
+        立即开始播放音源，丢弃原有的曲目
+        :param source: 音源，需提供 read(frames) 与 close()
+        :param duration: 时长（秒），未知时为None
+        :return: None
+        """
+        self.close()
+        self.current, self.currentEnd, self.position = source, self.frames(duration), 0
+        self.fadeStart = None
+
+    def close(self) -> None:
+        """关闭当前曲目与下一首的音源"""
+        for source in (self.current, self.next):
+            if source is not None:
+                source.close()
+        self.current = self.next = None
+
+    def queue(self, source, duration: float = None) -> None:
+        """
+        排定下一首，按当前曲目的时长计算淡变的起点
+        :param source: 音源
+        :param duration: 时长（秒），未知时为None
+        :return: None
+        """
+        if self.current is None:
+            self.play(source, duration)
+            return
+        if self.next is not None:
+            self.next.close()
+        self.next, self.nextEnd, self.nextPosition = source, self.frames(duration), 0
+
+        fade = int(round(self.crossfade * self.sampleRate))
+        if self.currentEnd is None:
+            fade = 0
+        else:
+            # 淡变不超过任一曲目的一半，也不早于已经播放到的位置
+            fade = min(fade, self.currentEnd // 2, self.currentEnd - self.position)
+            if self.nextEnd is not None:
+                fade = min(fade, self.nextEnd // 2)
+        fade = max(fade, 0)
+        # 无缝衔接在音源结束时切换，不依赖时长
+        self.fadeStart = None if self.currentEnd is None or fade == 0 else self.currentEnd - fade
+        self.fadeOut, self.fadeIn = fade_curves(self.curve, fade)
+
+    def advance(self) -> None:
+        """下一首成为当前曲目"""
+        self.current.close()
+        self.current, self.currentEnd, self.position = self.next, self.nextEnd, self.nextPosition
+        self.next = None
+        self.fadeStart = None
+        self.transitions.append(self.played - self.nextPosition)
+
+    def read(self, frames: int = BLOCK_FRAMES) -> np.ndarray:
+        """
+        输出下一块混音结果，返回帧数不足说明全部播放完毕
+        :param frames: 帧数
+        :return: (帧数, 声道数) 的float32
+        """
+        out = np.zeros((frames, self.channels), dtype=np.float32)
+        filled = 0
+        while filled < frames and self.current is not None:
+            fade = len(self.fadeIn)
+            if self.next is not None and self.fadeStart is not None and self.position >= self.fadeStart:
+                offset = self.position - self.fadeStart
+                if offset >= fade:
+                    self.advance()
+                    continue
+                count = min(frames - filled, fade - offset)
+                outgoing = self.current.read(count)
+                incoming = self.next.read(count)
+                block = out[filled:filled + count]
+                block[:len(outgoing)] += outgoing * self.fadeOut[offset:offset + len(outgoing), None]
+                block[:len(incoming)] += incoming * self.fadeIn[offset:offset + len(incoming), None]
+                # 当前曲目提前结束时按计划的帧数继续推进，保持切换点不变
+                self.position += count
+                self.nextPosition += len(incoming)
+                filled += count
+                self.played += count
+                continue
+
+            count = frames - filled
+            if self.next is not None and self.fadeStart is not None:
+                count = min(count, self.fadeStart - self.position)
+            block = self.current.read(count)
+            out[filled:filled + len(block)] = block
+            self.position += len(block)
+            filled += len(block)
+            self.played += len(block)
+            if len(block) < count:
+                if self.next is None:
+                    self.current.close()
+                    self.current = None
+                    break
+                # 音源比已知时长短：不留空白，直接接上下一首
+                logger.info(f"音源在第{self.position}帧提前结束，直接切换到下一首")
+                self.fadeStart, self.fadeOut, self.fadeIn = self.position, self.fadeOut[:0], self.fadeIn[:0]
+        return out[:filled]
+
+
+def write_wav(output: str, sampleRate: int, channels: int):
+    wfp = wave.open(output, "wb")
+    wfp.setnchannels(channels)
+    wfp.setsampwidth(2)
+    wfp.setframerate(sampleRate)
+    return wfp
+
+
+def decoded_durations(files: list, sampleRate: int = 44100) -> dict:
+    """
+    获取曲目的精确时长：解码缓存与源文件一致且采样率相同时按缓存头部的采样数计算，
+    其余曲目退回 ffprobe 的时长（精确到10毫秒）
+    :param files: 音乐文件列表
+    :param sampleRate: 混音采样率
+    :return: {文件路径: 秒}
+    """
+    result = {}
+    for music_file in files:
+        try:
+            stat = os.stat(music_file)
+        except OSError:
+            continue
+        cached = open_pcm(pcm_cache_path(music_file), stat.st_size, stat.st_mtime)
+        if cached is not None and cached[1] == sampleRate and len(cached[0]):
+            result[music_file] = len(cached[0]) / sampleRate
+    missing = [music_file for music_file in files if music_file not in result]
+    if missing:
+        result.update(media_tools().probe_durations(missing))
+    return result
+
+
+def render_mix(files: list, output: str, crossfade: float = 0.0, curve: str = "equal_power",
+               sampleRate: int = 44100, channels: int = 2) -> dict:
+    """
+    离线把多首曲目按顺序混音写入WAV，用于检查切换点
+    :param files: 音乐文件列表
+    :param output: 输出WAV路径
+    :param crossfade: 淡入淡出时长（秒）
+    :param curve: 淡入淡出曲线
+    :param sampleRate: 采样率
+    :param channels: 声道数
+    :return: 统计信息，transitions 为每个切换点的帧偏移
+    """
+    durations = decoded_durations(files, sampleRate)
+    mixer = Mixer(sampleRate, channels, crossfade, curve)
+    pending = list(files)
+    mixer.play(DecoderSource(pending[0], sampleRate, channels), durations.get(pending.pop(0)))
+    temp = output + ".part.wav"
+    with write_wav(temp, sampleRate, channels) as wfp:
+        while True:
+            if pending and mixer.next is None:
+                mixer.queue(DecoderSource(pending[0], sampleRate, channels), durations.get(pending.pop(0)))
+            block = mixer.read(BLOCK_FRAMES)
+            wfp.writeframes((np.clip(block, -1, 32767 / 32768) * 32768).astype("<i2").tobytes())
+            if len(block) < BLOCK_FRAMES and mixer.current is None:
+                break
+    os.replace(temp, output)
+    logger.info(f"混音完成：{output}，{mixer.played / sampleRate:.2f}s，切换点{mixer.transitions}")
+    return {"frames": mixer.played, "transitions": mixer.transitions}
+
+
+def transition_jumps(samples: np.ndarray, transitions: list, radius: int = 64) -> list:
+    """
+    检查切换点附近的连续性：切换点前后的最大相邻采样差与之前一段的最大相邻差之比，
+    接近1说明没有爆音或空白造成的突变
+    :param samples: (帧数, 声道数) 的采样
+    :param transitions: 切换点的帧偏移
+    :param radius: 检查的半径（帧）
+    :return: list[float]
+    """
+    result = []
+    diff = np.abs(np.diff(samples.astype(np.float32), axis=0)).max(axis=-1)
+    for frame in transitions:
+        around = diff[max(frame - radius, 0):frame + radius]
+        before = diff[max(frame - 8 * radius, 0):max(frame - radius, 0)]
+        baseline = before.max() if len(before) else 0
+        result.append(float(around.max() / baseline) if baseline > 0 and len(around) else 0.0)
+    return result
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="离线渲染无缝/淡入淡出混音")
+    parser.add_argument("files", nargs="+", help="按播放顺序排列的音乐文件")
+    parser.add_argument("-o", "--output", default="mix.wav", help="输出WAV路径")
+    parser.add_argument("-x", "--crossfade", type=float, default=0.0, help="淡入淡出时长（秒），0为无缝衔接")
+    parser.add_argument("-c", "--curve", default="equal_power", choices=CURVES, help="淡入淡出曲线")
+    parser.add_argument("-r", "--rate", type=int, default=44100, help="采样率")
+    args = parser.parse_args(argv)
+
+    report = render_mix(args.files, args.output, args.crossfade, args.curve, args.rate)
+    with wave.open(args.output, "rb") as rfp:
+        samples = np.frombuffer(rfp.readframes(rfp.getnframes()), dtype="<i2").reshape(-1, rfp.getnchannels())
+    for frame, ratio in zip(report["transitions"], transition_jumps(samples, report["transitions"])):
+        print(f"{frame / args.rate:10.3f}s  突变比 {ratio:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 import os
 import sys
 import json
-import subprocess
+import numpy as np
 from loguru import logger
 from PyQt5.QtWidgets import (
     QApplication,
@@ -18,11 +18,21 @@ from PyQt5.QtCore import (
     QTimer,
     Qt,
     QPoint,
-    QSize, QPropertyAnimation, QEasingCurve,
+    QSize, QPropertyAnimation, QEasingCurve, QLine, pyqtSignal,
 )
 from PyQt5.QtSvg import QSvgRenderer
-from PyQt5.QtGui import QPixmap, QIcon, QPainter
+from PyQt5.QtGui import QPixmap, QIcon, QPainter, QColor
 from MusicVisualizer import AudioVisualizer
+from WaveformPeaks import get_peaks
+from PcmCache import load_pcm
+from PcmRing import PcmStream
+from Fingerprint import duplicate_canonical
+from Session import load_session, save_session, track_snapshot
+from TrackModel import Track
+from AnalysisScheduler import analysis_scheduler, PLAYING, NEXT
+from PcmCache import pcm_cache_path
+from WaveformPeaks import peaks_cache_path
+from BeatTrack import beats_cache_path
 
 PATH = os.path.split(__file__)[0]
 
@@ -67,68 +77,6 @@ def MusicPlayerCache(key: str, value: dict = None, rw: bool = True) -> dict or b
     return True
 
 
-def get_music_cover(music_file) -> str or None:
-    cache_dir = "./cache"
-    os.makedirs(cache_dir, exist_ok=True)  # 创建缓存目录
-
-    output_file = os.path.join(cache_dir, os.path.basename(music_file).replace(".", "_") + "_cover.jpg")  # 生成保存路径
-    if os.path.isfile(output_file) is True:
-        return output_file
-
-    try:
-        cmd = [
-            '.\\FFmpeg\\ffmpeg.exe',
-            '-i', f"{music_file}",
-            '-an', '-vcodec', 'copy',
-            f"{output_file}"
-        ]  # ffmpeg命令
-        result = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT
-        )
-        output, _ = result.communicate()  # 等待子进程结束并获取输出
-
-        if result.returncode == 0 and os.path.exists(output_file):
-            return output_file
-        else:
-            return None
-    except Exception as e:
-        logger.error(f"获取封面错误: {e}")
-        return None
-
-
-def get_audio_duration(audio_file_path: str) -> int:
-    """
-    使用subprocess运行ffprobe命令获取音频文件的总长度
-    :param audio_file_path: 文件路径
-    :return: int
-    """
-    result = 100
-    logger.info(f"获取{audio_file_path}的总时长")
-    try:
-        cmd = [
-            r".\FFmpeg\ffprobe.exe",
-            "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1",
-            audio_file_path
-        ]
-        result = subprocess.check_output(
-            cmd,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True
-        )
-
-        # 将结果转换为浮点数，然后取整
-        result = int(float(result.split('\n')[0].strip()))
-        logger.info(f"获取到长度：{result}")
-        return result
-    except subprocess.CalledProcessError as e:
-        logger.error("Error running ffprobe:", e)
-        return 100
-
-
 class CustomProgressBar(QSlider):
     """自定义音乐进度条"""
     def __init__(self):
@@ -153,6 +101,65 @@ class CustomProgressBar(QSlider):
         """)
 
         self.dragging = False  # 用于标记是否正在拖动
+        self.peaks = None  # 波形峰值金字塔
+        self.waveformCache = None  # 当前宽高对应的波形线段
+
+    def setPeaks(self, peaks) -> None:
+        """
+        设置波形峰值金字塔，设置后进度条绘制为波形
+        :param peaks: PeakPyramid or None
+        :return: None
+        """
+        self.peaks = peaks
+        self.waveformCache = None
+        if peaks is not None:
+            self.setMinimumHeight(32)
+        self.update()
+
+    def resizeEvent(self, event):
+        # 尺寸变化只需从金字塔重新取列，不会重新读取音频
+        self.waveformCache = None
+        super().resizeEvent(event)
+
+    def waveformLines(self) -> tuple:
+        """
+        根据当前宽度生成波形线段
+        :return: (峰值线段, RMS线段)
+        """
+        width, height = self.width(), self.height()
+        if self.waveformCache is None or self.waveformCache[0] != (width, height):
+            mins, maxs, rms = self.peaks.columns(width)
+            middle = height / 2
+            top = np.round(middle - maxs * middle).astype(int).tolist()
+            bottom = np.round(middle - mins * middle).astype(int).tolist()
+            rmsHeight = np.round(rms * middle).astype(int).tolist()
+            peakLines = [QLine(x, top[x], x, bottom[x]) for x in range(width)]
+            rmsLines = [
+                QLine(x, int(middle) - rmsHeight[x], x, int(middle) + rmsHeight[x])
+                for x in range(width)
+            ]
+            self.waveformCache = ((width, height), peakLines, rmsLines)
+        return self.waveformCache[1], self.waveformCache[2]
+
+    def paintEvent(self, event):
+        if self.peaks is None:
+            super().paintEvent(event)
+            return
+
+        peakLines, rmsLines = self.waveformLines()
+        span = max(self.maximum() - self.minimum(), 1)
+        played = int(self.width() * (self.value() - self.minimum()) / span)
+
+        painter = QPainter(self)
+        painter.setPen(QColor(241, 241, 241, 128))
+        painter.drawLines(peakLines[played:])
+        painter.setPen(QColor(241, 241, 241, 200))
+        painter.drawLines(rmsLines[played:])
+        painter.setPen(QColor(0, 0, 255, 128))
+        painter.drawLines(peakLines[:played])
+        painter.setPen(QColor(33, 150, 243, 220))
+        painter.drawLines(rmsLines[:played])
+        painter.end()
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
@@ -236,20 +243,39 @@ class SvgButton(QPushButton):
 
 class MusicPlayer(QMainWindow):
     """音乐播放器"""
-    def __init__(self, musicFile: str):
+    analysisReady = pyqtSignal(str, str, object)  # 分析类型, 文件路径, Future；从调度线程转到界面线程
+
+    def __init__(self, musicFile: str, queue: list = None, snapshot: dict = None):
         """
         :param musicFile: 音乐文件路径
+        :param queue: 播放队列（路径或Track），默认只包含musicFile
+        :param snapshot: 上次退出时的会话快照
         """
         logger.info("初始化音乐播放器")
         super().__init__(parent=None)
+        snapshot = snapshot or {}
+        track = track_snapshot(snapshot, musicFile)
         self.musicFile = musicFile  # 音乐文件路径
-        self.audioDuration = get_audio_duration(self.musicFile)
-        self.musicCover = get_music_cover(self.musicFile)
+        self.cacheKey = self.playCacheKey(self.musicFile)  # 播放缓存的键，重复曲目共用
+        # 播放队列
+        self.playQueue = [item if isinstance(item, Track) else Track(item) for item in queue or [musicFile]]
+        self.currentTrack = Track(musicFile)
+        self.queueIndex = 0
+        if self.currentTrack in self.playQueue:
+            self.queueIndex = self.playQueue.index(self.currentTrack)
+            self.currentTrack = self.playQueue[self.queueIndex]
+        self.audioDuration, self.musicCover = self.trackInfo(
+            self.musicFile, track or {"duration": self.currentTrack.duration}
+        )
+        self.currentTrack.duration = self.audioDuration
+        self.restoreMaximized = snapshot.get("maximized", False)
+        self.analysisGroups = set()  # 当前提交给分析调度器的分组
+        self.analysisReady.connect(self.onAnalysisReady)
         self.dragging = False  # 记录是否正在拖动
         self.drag_start_position = QPoint()
 
         self.setWindowTitle("Music Player")
-        self.setGeometry(100, 100, 960, 640)
+        self.setGeometry(*snapshot.get("geometry", (100, 100, 960, 640)))
 
         # 隐藏窗口标题栏和边框
         self.setWindowFlags(Qt.CustomizeWindowHint)
@@ -318,24 +344,19 @@ class MusicPlayer(QMainWindow):
         ProgressLayout.setSpacing(0)
 
         self.initProgressSlider()
+        if track.get("position"):
+            self.playingTime = track["position"]
+            self.progressSlider.setValue(self.playingTime)
+            self.playbackLabel.setText(self.formatSeconds(self.playingTime))
         self.progressSlider.valueChanged.connect(self.updateProgressPlayingTime)
 
         FunctionTransverseLayout = QHBoxLayout()
-        if self.musicCover:
-            self.MusicBgImg = QLabel()
-            self.MusicBgImg.setPixmap(
-                QPixmap(
-                    self.musicCover
-                ).scaled(
-                    QSize(64, 64),
-                    Qt.AspectRatioMode.KeepAspectRatio
-                )
-            )
-            # 设置MusicBgImg的大小
-            self.MusicBgImg.setFixedSize(64, 64)
-
-            self.MusicBgImg.setStyleSheet("border: none; background-color: transparent;")
-            FunctionTransverseLayout.addWidget(self.MusicBgImg, alignment=Qt.AlignLeft)
+        self.MusicBgImg = QLabel()
+        # 设置MusicBgImg的大小
+        self.MusicBgImg.setFixedSize(64, 64)
+        self.MusicBgImg.setStyleSheet("border: none; background-color: transparent;")
+        self.setCover(self.musicCover)
+        FunctionTransverseLayout.addWidget(self.MusicBgImg, alignment=Qt.AlignLeft)
 
         FunctionTransverseLayout.addItem(QSpacerItem(2, 10, QSizePolicy.Expanding, QSizePolicy.Minimum))
 
@@ -348,6 +369,7 @@ class MusicPlayer(QMainWindow):
         self.PreviousSongButton = SvgButton(".\\img\\PreviousSongButton.svg")
         self.PreviousSongButton.setEnabled(True)
         self.PreviousSongButton.setFixedSize(32, 32)
+        self.PreviousSongButton.clicked.connect(lambda: self.switchTrack(-1))
         FunctionTransverseLayout.addWidget(self.PreviousSongButton)
 
         FunctionTransverseLayout.addItem(QSpacerItem(10, 10, QSizePolicy.Expanding, QSizePolicy.Minimum))
@@ -363,6 +385,7 @@ class MusicPlayer(QMainWindow):
         self.NextSongButton = SvgButton(".\\img\\NextSongButton.svg")
         self.NextSongButton.setFixedSize(32, 32)
         self.NextSongButton.setEnabled(True)
+        self.NextSongButton.clicked.connect(lambda: self.switchTrack(1))
         FunctionTransverseLayout.addWidget(self.NextSongButton)
 
         FunctionTransverseLayout.addItem(QSpacerItem(10, 10, QSizePolicy.Expanding, QSizePolicy.Minimum))
@@ -372,8 +395,292 @@ class MusicPlayer(QMainWindow):
 
         centralWidget.setLayout(MainLayout)
         self.setCentralWidget(centralWidget)
+        self.scheduleAnalysis()
         logger.info("初始化音乐播放器成功")
 
+    @classmethod
+    def restore(cls, musicFile: str = None) -> "MusicPlayer":
+        """
+        按上次退出时的会话快照创建播放器，快照中的曲目已不存在时使用musicFile
+        :param musicFile: 默认音乐文件路径
+        :return: MusicPlayer
+        """
+        snapshot = load_session("player")
+        path = (snapshot.get("track") or {}).get("path")
+        if path and os.path.isfile(path):
+            musicFile = path
+        queue = [Track.from_dict(item) for item in snapshot.get("queue", []) if os.path.isfile(item.get("path", ""))]
+        return cls(musicFile, queue or None, snapshot)
+
+    @staticmethod
+    def trackInfo(musicFile: str, track: dict) -> tuple:
+        """
+        获取已知的时长和封面（来自快照或播放队列），未知的部分为0和None，由 scheduleAnalysis 在后台补全
+        :param musicFile: 音乐文件路径
+        :param track: track_snapshot 返回的曲目快照
+        :return: (时长, 封面路径)
+        """
+        duration = track.get("duration") or 0
+        cover = track.get("cover")
+        if cover and os.path.isfile(cover) is False:
+            cover = None
+        return duration, cover
+
+    def setCover(self, cover: str or None) -> None:
+        """
+        显示封面，没有封面时隐藏
+        :param cover: 封面路径
+        :return: None
+        """
+        if cover:
+            self.MusicBgImg.setPixmap(
+                QPixmap(
+                    cover
+                ).scaled(
+                    QSize(64, 64),
+                    Qt.AspectRatioMode.KeepAspectRatio
+                )
+            )
+        self.MusicBgImg.setVisible(bool(cover))
+
+    def switchTrack(self, offset: int) -> None:
+        """
+        切换到播放队列中的上一首或下一首
+        :param offset: -1 为上一首，1 为下一首
+        :return: None
+        """
+        if len(self.playQueue) < 2:
+            return
+        self.queueIndex = (self.queueIndex + offset) % len(self.playQueue)
+        self.loadTrack(self.playQueue[self.queueIndex])
+
+    def loadTrack(self, track: Track) -> None:
+        """
+        在当前窗口中载入另一首曲目，原先正在播放时由同一个播放流直接切换，不重启ffplay
+        :param track: 播放队列中的曲目
+        :return: None
+        """
+        logger.info(f"切换曲目：{track.path}")
+        stream = self.music_process if self.playing else None
+        if stream is not None and stream.poll() is not None:
+            stream = None
+        wasPlaying = self.playing
+        if stream is not None:
+            # 与暂停时一样记录原曲目的播放位置
+            MusicPlayerCache(
+                self.cacheKey,
+                {"playingTime": self.playingTime + 1},
+                rw=False
+            )
+        elif wasPlaying:
+            self.togglePlayPause()
+
+        self.showTrack(track)
+        if stream is not None:
+            cache = self.playCache()
+            self.playingTime = cache['playingTime'] if cache else 0
+            stream.switch(self.musicFile, self.playingTime)
+            self.queueFollowing()
+            self.visualizer.attach_stream(stream)
+            self.visualizer.update_visualization(self.playingTime)
+        elif wasPlaying:
+            self.togglePlayPause()
+
+    def showTrack(self, track: Track) -> None:
+        """
+        界面切换到另一首曲目并提交其分析，不涉及播放
+        :param track: 播放队列中的曲目
+        :return: None
+        """
+        musicFile = track.path
+        self.currentTrack.position = self.playingTime
+        self.currentTrack = track
+        self.musicFile = musicFile
+        self.cacheKey = self.playCacheKey(musicFile)
+        self.audioDuration, self.musicCover = self.trackInfo(musicFile, {"duration": track.duration})
+        track.duration = self.audioDuration
+        self.visualizer.load_file(musicFile)
+        self.playingTime = 0
+
+        self.progressSlider.blockSignals(True)
+        self.progressSlider.setMaximum(self.audioDuration)
+        self.progressSlider.setValue(0)
+        self.progressSlider.setPeaks(None)
+        self.playbackLabel.setText(self.formatSeconds(0))
+        self.initProgressSlider()
+        self.progressSlider.blockSignals(False)
+
+        self.MusicNameShow.setText(os.path.split(self.musicFile)[-1].split(".", 1)[0])
+        self.setCover(self.musicCover)
+        self.scheduleAnalysis()
+
+    def queueFollowing(self) -> None:
+        """把播放队列中的下一首排入正在播放的流，当前曲目结束时无缝接上"""
+        following = self.followingTrack()
+        if following is None or following == self.currentTrack:
+            return
+        if self.music_process is not None and self.music_process.poll() is None:
+            self.music_process.queue(following.path)
+
+    def followStream(self, path: str) -> None:
+        """
+        播放流已在当前曲目结束后接上下一首，界面随之切换，播放不中断
+        :param path: 播放流正在播放的文件
+        :return: None
+        """
+        following = self.followingTrack()
+        if following is None or following.path != path:
+            return
+        logger.info(f"无缝切换到下一首：{path}")
+        # 原曲目已播放完毕，下次从头播放
+        MusicPlayerCache(self.cacheKey, {"playingTime": 0}, rw=False)
+        self.queueIndex = (self.queueIndex + 1) % len(self.playQueue)
+        self.showTrack(following)
+        self.visualizer.attach_stream(self.music_process)
+        self.visualizer.update_visualization(0)
+        self.queueFollowing()
+
+    def followingTrack(self) -> Track or None:
+        if len(self.playQueue) < 2:
+            return None
+        return self.playQueue[(self.queueIndex + 1) % len(self.playQueue)]
+
+    def submitAnalysis(self, kind: str, track: Track, priority: int, group: str) -> None:
+        analysis_scheduler().submit(kind, track.path, priority, group).add_done_callback(
+            lambda future: self.analysisReady.emit(kind, track.path, future)
+        )
+
+    def scheduleAnalysis(self) -> None:
+        """
+        当前曲目的时长、封面、解码、波形与响度全部交给分析调度器，界面线程不做解码和ffprobe；
+        同时预先分析播放队列中的下一首。依赖解码缓存的分析在解码完成后再提交，避免重复解码。
+        先以新的分组提交，原先作为下一首预分析的任务会被提升为PLAYING，再取消不再需要的旧分组
+        :return: None
+        """
+        track = self.currentTrack
+        groups = {"player:" + track.path}
+        self.submitAnalysis("pcm", track, PLAYING, "player:" + track.path)
+        if not self.audioDuration:
+            self.submitAnalysis("duration", track, PLAYING, "player:" + track.path)
+        if self.musicCover is None:
+            self.submitAnalysis("cover", track, PLAYING, "player:" + track.path)
+
+        following = self.followingTrack()
+        if following is not None and following != track:
+            groups.add("player-next:" + following.path)
+            self.submitAnalysis("pcm", following, NEXT, "player-next:" + following.path)
+            self.submitAnalysis("cover", following, NEXT, "player-next:" + following.path)
+            if not following.duration:
+                self.submitAnalysis("duration", following, NEXT, "player-next:" + following.path)
+
+        scheduler = analysis_scheduler()
+        for group in self.analysisGroups - groups:
+            scheduler.cancel_group(group)
+        self.analysisGroups = groups
+
+    def onAnalysisReady(self, kind: str, path: str, future) -> None:
+        """
+        在界面线程中处理完成的分析，已切换到其他曲目的结果只记录到播放队列
+        :param kind: 分析类型
+        :param path: 文件路径
+        :param future: 分析任务
+        :return: None
+        """
+        if future.cancelled() or future.exception() is not None:
+            return
+        result = future.result()
+        current = path == self.currentTrack.path
+        following = self.followingTrack()
+        if kind == "pcm":
+            if current:
+                for name in ("peaks", "loudness"):
+                    self.submitAnalysis(name, self.currentTrack, PLAYING, "player:" + path)
+            elif following is not None and following.path == path:
+                for name in ("peaks", "beats", "loudness"):
+                    self.submitAnalysis(name, following, NEXT, "player-next:" + path)
+            return
+        if kind == "duration":
+            for track in self.playQueue:
+                if track.path == path:
+                    track.duration = result
+        if current is False:
+            return
+
+        if kind == "duration":
+            self.audioDuration = self.currentTrack.duration = result
+            # 时长为0时进度条会把数值截断为0，取得时长后重新应用播放位置或缓存的续播位置
+            self.progressSlider.blockSignals(True)
+            self.progressSlider.setMaximum(self.audioDuration)
+            self.progressSlider.setValue(self.playingTime)
+            self.playbackLabel.setText(self.formatSeconds(self.playingTime))
+            if self.playing is False and self.playingTime == 0:
+                self.initProgressSlider()
+            self.progressSlider.blockSignals(False)
+        elif kind == "cover":
+            self.musicCover = result
+            self.setCover(result)
+        elif kind == "peaks":
+            self.progressSlider.setPeaks(get_peaks(path, lambda: load_pcm(path)))
+        elif kind == "loudness" and result is not None:
+            self.currentTrack.gain = result["gain"]
+
+    def saveSession(self) -> None:
+        """
+        保存会话快照：窗口位置、播放队列、当前曲目、播放位置以及各项分析缓存的位置
+        :return: None
+        """
+        geometry = self.normalGeometry() if self.isMaximized() else self.geometry()
+        self.currentTrack.position = self.playingTime
+        try:
+            stat = os.stat(self.musicFile)
+        except OSError as e:
+            logger.error(f"保存会话快照失败: {e}")
+            return
+        save_session("player", {
+            "geometry": [geometry.x(), geometry.y(), geometry.width(), geometry.height()],
+            "maximized": self.isMaximized(),
+            "queue": [track.to_dict() for track in self.playQueue],
+            "queueIndex": self.queueIndex,
+            "track": {
+                "path": os.path.abspath(self.musicFile),
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "position": self.playingTime,
+                "duration": self.audioDuration,
+                "cover": self.musicCover,
+                "artefacts": {
+                    "pcm": pcm_cache_path(self.musicFile),
+                    "peaks": peaks_cache_path(self.musicFile),
+                    "beats": beats_cache_path(self.musicFile),
+                },
+            },
+        })
+
+    @staticmethod
+    def playCacheKey(musicFile: str) -> str:
+        """
+        获取播放缓存的键，指纹判定为重复的曲目共用代表文件的键
+        :param musicFile: 音乐文件路径
+        :return: str
+        """
+        canonical = duplicate_canonical(musicFile)
+        if canonical is not None:
+            return canonical
+        return os.path.split(musicFile)[-1]
+
+    def playCache(self) -> dict or None:
+        """
+        读取播放缓存；重复组的曲目没有新键的记录时沿用以文件名为键的旧记录，并迁移到新键
+        :return: dict or None
+        """
+        cache = MusicPlayerCache(self.cacheKey)
+        legacyKey = os.path.split(self.musicFile)[-1]
+        if cache is None and self.cacheKey != legacyKey:
+            cache = MusicPlayerCache(legacyKey)
+            if cache is not None:
+                MusicPlayerCache(self.cacheKey, cache, rw=False)
+        return cache
+
     def toggleMaximized(self) -> None:
         """
         检查窗口是否处于最大化状态，并相应地切换最大化和还原窗口的状态。
@@ -403,7 +710,7 @@ class MusicPlayer(QMainWindow):
             if self.music_process and self.music_process.poll() is None:
                 self.stopMusic()
                 MusicPlayerCache(
-                    os.path.split(self.musicFile)[-1],
+                    self.cacheKey,
                     {"playingTime": self.playingTime + 1},
                     rw=False
                 )
@@ -420,27 +727,22 @@ class MusicPlayer(QMainWindow):
         :return: None
         """
         logger.info("开始播放")
-        cache = MusicPlayerCache(
-            os.path.split(self.musicFile)[-1]
-        )
+        cache = self.playCache()
         if cache:
             self.playingTime = cache['playingTime']
             self.visualizer.update_visualization(
                 self.playingTime
             )
 
-        cmd = [
-            ".\\FFmpeg\\ffplay.exe",
-            "-i", self.musicFile,
-            "-nodisp", "-autoexit", "-exitonkeydown",
-            "-ss", str(self.playingTime),
-        ]
-        self.music_process = subprocess.Popen(
-            cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
+        # 同一个播放流负责输出、可视化与曲目之间的衔接
+        self.music_process = PcmStream(
+            self.musicFile,
+            self.playingTime,
+            self.visualizer.FileSamplingRate
         )
+        self.music_process.start()
+        self.queueFollowing()
+        self.visualizer.attach_stream(self.music_process)
         logger.info("播放成功")
 
     def stopMusic(self) -> None:
@@ -449,8 +751,10 @@ class MusicPlayer(QMainWindow):
         :return: None
         """
         if self.music_process is not None and self.timer is not None:
-            self.music_process.terminate()
-            self.music_process.wait()
+            # 已播放结束或已停止的流不再重复停止
+            if self.music_process.poll() is None:
+                self.music_process.terminate()
+                self.music_process.wait()
             self.timer.stop()
             logger.info("停止播放")
         else:
@@ -464,8 +768,13 @@ class MusicPlayer(QMainWindow):
         if self.playingTime == 0:
             logger.info("开始更新播放位置")
         try:
-            if self.playingTime < self.audioDuration:
-                self.playingTime += 1
+            # 播放流在整个播放队列结束后才退出，曲目之间由混音器无缝衔接
+            if self.music_process is not None and self.music_process.poll() is None:
+                path, seconds = self.music_process.current_track()
+                if path != self.currentTrack.path:
+                    self.followStream(path)
+                # 以实际送入ffplay的位置为准；时长尚未获取到时为0，不做截断
+                self.playingTime = int(seconds) if self.audioDuration == 0 else min(int(seconds), self.audioDuration)
                 self.playbackLabel.setText(self.formatSeconds(self.playingTime))
                 self.progressSlider.setValue(self.playingTime)
             else:
@@ -487,9 +796,7 @@ class MusicPlayer(QMainWindow):
         return f"{minutes}:{seconds:02}/{DuratonMinutes}:{DuratonSeconds}"
 
     def initProgressSlider(self) -> None:
-        cache = MusicPlayerCache(
-            os.path.split(self.musicFile)[-1]
-        )
+        cache = self.playCache()
         if cache:
             self.progressSlider.setValue(cache['playingTime'])
             self.playbackLabel.setText(
@@ -504,11 +811,9 @@ class MusicPlayer(QMainWindow):
         if self.music_process and self.music_process.poll() is None:
             new_time = self.progressSlider.value()
             if new_time != self.playingTime:
-                self.stopMusic()
-                self.timer.stop()
                 self.playingTime = new_time
                 MusicPlayerCache(
-                    os.path.split(self.musicFile)[-1],
+                    self.cacheKey,
                     {"playingTime": self.playingTime},
                     rw=False
                 )
@@ -517,14 +822,15 @@ class MusicPlayer(QMainWindow):
                         self.progressSlider.value()
                     )
                 )
-                self.playMusic()
-                self.timer.start(1000)
+                # 在同一个播放流中跳转，不重启ffplay
+                self.music_process.switch(self.musicFile, self.playingTime)
+                self.queueFollowing()
                 logger.info(f"更新音乐进度条值：{self.playingTime}")
                 self.visualizer.update_visualization(self.playingTime)
         else:
             self.playingTime = self.progressSlider.value()
             MusicPlayerCache(
-                os.path.split(self.musicFile)[-1],
+                self.cacheKey,
                 {"playingTime": self.playingTime},
                 rw=False
             )
@@ -537,12 +843,14 @@ class MusicPlayer(QMainWindow):
 
     def closeEvent(self, event) -> None:
         self.stopMusic()
+        analysis_scheduler().shutdown()
         if self.playingTime != 0:
             MusicPlayerCache(
-                os.path.split(self.musicFile)[-1],
+                self.cacheKey,
                 {"playingTime": self.playingTime},
                 rw=False
             )
+        self.saveSession()
 
     # 重写鼠标按下事件，以实现窗口的拖动
     def mousePressEvent(self, event):
@@ -559,6 +867,9 @@ class MusicPlayer(QMainWindow):
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
-    player = MusicPlayer("..\\EK-U - I Took A Pill In Lbiza (Remix).flac")#"D:\\Python_MX\\PyFusionInnovator\\temp.wav")
-    player.show()
+    player = MusicPlayer.restore("..\\EK-U - I Took A Pill In Lbiza (Remix).flac")#"D:\\Python_MX\\PyFusionInnovator\\temp.wav")
+    if player.restoreMaximized:
+        player.showMaximized()
+    else:
+        player.show()
     sys.exit(app.exec_())
@@ -1,33 +1,32 @@
+import os
 import sys
 import numpy as np
-from pydub import AudioSegment
 from loguru import logger
+from PcmCache import load_pcm, PCM_SAMPLE_RATE
+from Transcoder import output_path, transcode_file
+from BeatTrack import get_beats
+from AnalysisScheduler import analysis_scheduler, PLAYING
+from Spectrum import COLOR_GRADE, SAMPLE_SCALE, spectrum, spectrum_grade, window_size
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow,
     QWidget,
     QVBoxLayout,
 )
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QTimer, pyqtSignal
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 
-# AudioSegment.converter = "D:\\Programs\\ffmpeg\\bin\\ffmpeg.exe"
-# AudioSegment.ffmpeg = "D:\\Programs\\ffmpeg\\bin\\ffmpeg.exe"
-# AudioSegment.ffprobe = "D:\\Programs\\ffmpeg\\bin\\ffprobe.exe"
-
 
 class AudioVisualizer(QMainWindow):
     """用于显示音频，音乐可视化"""
+    analysisReady = pyqtSignal(str, str, object)  # 分析类型, 文件路径, Future；从调度线程转到界面线程
+
     def __init__(self, wavFile: str):
         """
         :param wavFile: wav文件的路径
         """
         super().__init__()
         logger.info(f"开始初始化可视化类")
-        self.wavFile = wavFile
-        self.sound = AudioSegment.from_file(
-            file=self.wavFile
-        )
         self.playing = False
         self.start_time = 0  # 新增变量来存储开始时间
         self.fill_area = None
@@ -42,10 +41,41 @@ class AudioVisualizer(QMainWindow):
         self.canvas = FigureCanvas(self.figure)
         self.layout.addWidget(self.canvas)
 
-        self.LeftVocalTract = self.sound.split_to_mono()[0]
-        self.FileSamplingRate = self.LeftVocalTract.frame_rate
-        self.NumberOfSamples = len(self.LeftVocalTract.get_array_of_samples())
-        self.windowSize = int(0.02 * self.FileSamplingRate)
+        self.color_grade = COLOR_GRADE
+        self.LineObject = None
+        self.frames = 0
+        self.stream = None  # 正在播放的PcmStream，存在时直接读取其环形缓冲
+        self.analysisGroup = None
+        self.analysisReady.connect(self.analysis_ready)
+
+        # 定时更新图像任务
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update)
+        self.load_file(wavFile)
+        logger.info(f"可视化类初始化完成")
+
+    def load_file(self, wavFile: str) -> None:
+        """
+        载入要显示的音频文件
+        :param wavFile: 音频文件的路径
+        :return: None
+        """
+        if self.playing:
+            self.stop_visualization()
+        self.stream = None
+        self.start_time = 0
+        self.wavFile = wavFile
+        # 左声道int16采样，由分析调度器在后台解码到缓存，完成后以内存映射读取
+        self.samples, self.FileSamplingRate = np.zeros(0, dtype=np.int16), PCM_SAMPLE_RATE
+        # 预先计算的节拍，用于驱动脉冲和换色；完成前按频谱等级显示
+        self.beats = None
+        previous, self.analysisGroup = self.analysisGroup, "visualizer:" + os.path.abspath(wavFile)
+        self.submit_analysis("pcm")
+        if previous is not None and previous != self.analysisGroup:
+            analysis_scheduler().cancel_group(previous)
+
+        self.NumberOfSamples = len(self.samples)
+        self.windowSize = window_size(self.FileSamplingRate)
         self.splitWindow = self.windowSize // 8
         # self.FrequencyAxis = np.linspace(20, 20 * 1000, self.splitWindow)
         self.FrequencyAxis = np.linspace(
@@ -54,14 +84,6 @@ class AudioVisualizer(QMainWindow):
             self.splitWindow
         )
         self.timeAxis = np.linspace(0, 1, self.windowSize)
-        self.color_grade = ['blue', 'yellow', 'red']
-        self.LineObject = None
-        self.frames = 0
-
-        # 定时更新图像任务
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update)
-        logger.info(f"可视化类初始化完成")
 
     def update_visualization(self, value) -> None:
         """
@@ -75,6 +97,37 @@ class AudioVisualizer(QMainWindow):
         self.start_visualization()
         logger.info("成功更新可视化数据")
 
+    def submit_analysis(self, kind: str) -> None:
+        analysis_scheduler().submit(kind, self.wavFile, PLAYING, self.analysisGroup).add_done_callback(
+            lambda future, wavFile=self.wavFile: self.analysisReady.emit(kind, wavFile, future)
+        )
+
+    def analysis_ready(self, kind: str, wavFile: str, future) -> None:
+        """
+        后台分析完成后在界面线程读取缓存，期间已切换到其他曲目时忽略；
+        解码完成后才提交节拍分析，两者不会同时解码同一个文件
+        :param kind: 分析类型
+        :param wavFile: 提交分析时的音频文件
+        :param future: 分析任务
+        :return: None
+        """
+        if future.cancelled() or future.exception() is not None or wavFile != self.wavFile:
+            return
+        if kind == "pcm":
+            self.samples, self.FileSamplingRate = load_pcm(wavFile)
+            self.NumberOfSamples = len(self.samples)
+            self.submit_analysis("beats")
+        elif kind == "beats":
+            self.beats = get_beats(wavFile)
+
+    def attach_stream(self, stream) -> None:
+        """
+        绑定正在播放的PcmStream，可视化与实际播放的数据保持一致
+        :param stream: PcmStream or None
+        :return: None
+        """
+        self.stream = stream
+
     def start_visualization(self) -> None:
         """
         启动可视化
@@ -124,61 +177,69 @@ class AudioVisualizer(QMainWindow):
         定时更新可视化任务
         :return:
         """
+        if self.stream is not None and self.stream.poll() is None:
+            _, self.start_time = self.stream.current_track()
+            y = self.stream.window(3 * self.windowSize) / SAMPLE_SCALE
+            self.draw_spectrum(y, self.start_time)
+            return
+
         start_frame = int(self.start_time * self.FileSamplingRate)
         end_frame = start_frame + self.windowSize
 
         # 在窗口开始之前和窗口结束之后添加零值样本
         if start_frame > 0:
             start_frame -= int(self.windowSize)
-        if end_frame < len(self.LeftVocalTract.get_array_of_samples()):
+        if end_frame < self.NumberOfSamples:
             end_frame += int(self.windowSize)
 
         # 截取样本
-        slice = self.LeftVocalTract.get_sample_slice(start_frame, end_frame)
-        y = np.array(slice.get_array_of_samples()) / 30000
+        y = self.samples[max(start_frame, 0):end_frame] / SAMPLE_SCALE
         # 检查窗口大小是否有效
         if len(y) < self.windowSize:
             return
-        yft = np.abs(np.fft.fft(y)) / (self.splitWindow)
-        grade = int(max(yft[:self.splitWindow]) - min(yft[:self.splitWindow]))
+        self.draw_spectrum(y, self.start_time)
+        self.start_time += self.windowSize / self.FileSamplingRate
+
+    def draw_spectrum(self, y, seconds: float) -> None:
+        """
+        绘制一帧频谱
+        :param y: 归一化后的采样窗口
+        :param seconds: 当前播放的秒数，用于查询节拍相位
+        :return: None
+        """
+        yft = spectrum(y, self.splitWindow)[:self.splitWindow]
+        beatIndex, phase = self.beats.beat_phase(seconds) if self.beats else (-1, 0.0)
 
         # 更新波浪线和填充区域
-        self.LineObject.set_ydata(yft[:self.splitWindow])
         self.fill_area.remove()  # 移除之前的填充区域
-
-        if 0 <= grade < len(self.color_grade):
-            self.LineObject.set_color(self.color_grade[grade])
-            self.fill_area = self.ax1.fill_between(
-                self.FrequencyAxis,
-                0,
-                yft[:self.splitWindow],
-                color=self.color_grade[grade],
-                alpha=0.5
-            )
+        color = "blue"
+        alpha = 0.5
+        if beatIndex >= 0:
+            # 每小节（4拍）换一次颜色，拍点处线条与填充随相位衰减形成脉冲
+            pulse = (1 - phase) ** 2
+            color = self.color_grade[(beatIndex // 4) % len(self.color_grade)]
+            alpha = 0.3 + 0.4 * pulse
+            self.LineObject.set_color(color)
+            self.LineObject.set_linewidth(1 + 2 * pulse)
         else:
-            self.fill_area = self.ax1.fill_between(
-                self.FrequencyAxis,
-                0,
-                yft[:self.splitWindow],
-                color="blue",
-                alpha=0.5
-            )
-        self.LineObject.set_ydata(yft[:self.splitWindow])
+            grade = spectrum_grade(yft)
+            if 0 <= grade < len(self.color_grade):
+                color = self.color_grade[grade]
+                self.LineObject.set_color(color)
+        self.fill_area = self.ax1.fill_between(
+            self.FrequencyAxis,
+            0,
+            yft,
+            color=color,
+            alpha=alpha
+        )
+        self.LineObject.set_ydata(yft)
         self.canvas.draw()
-        self.start_time += self.windowSize / self.FileSamplingRate
 
     def format_to_wav(self) -> str:
         """将音频文件转换为.wav格式并返回转换后的文件路径"""
-        wavFile = self.wavFile.replace(".mp3", ".wav")  # 将.mp3扩展名替换为.wav
-        sound = AudioSegment.from_file(file=self.wavFile)
-
-        if not sound.sample_width == 2:
-            sound = sound.set_sample_width(2)
-
-        if not sound.frame_rate == 44100:
-            sound = sound.set_frame_rate(44100)
-
-        sound.export(wavFile, format="wav")  # 导出为.wav文件
+        wavFile = output_path(self.wavFile, "wav")  # 只替换真正的扩展名
+        transcode_file(self.wavFile, wavFile, "wav", 44100, 2)
 
         return wavFile
 
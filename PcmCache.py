@@ -0,0 +1,201 @@
+import os
+import struct
+import subprocess
+import numpy as np
+from loguru import logger
+from MediaTools import tool_path
+from TrackModel import cache_key_digest
+
+PATH = os.path.split(__file__)[0]
+
+PCM_MAGIC = b"PFPC"
+PCM_VERSION = 1
+PCM_SAMPLE_RATE = 44100  # 缓存统一重采样到该采样率
+PCM_HEADER_BYTES = 64  # 头部补齐到64字节，数据区保持对齐
+# magic, 版本, 声道数, 采样率, 采样总数, 源文件大小, 源文件修改时间
+HEADER = struct.Struct("<4sHHIQQd")
+MAX_CACHE_BYTES = 2 * 1024 ** 3  # 解码缓存总大小上限
+READ_BYTES = 1 << 20
+
+
+def pcm_cache_dir() -> str:
+    cache_dir = os.path.join(PATH, "cache", "pcm")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def track_cache_key(music_file: str) -> str:
+    """
+    以绝对路径的哈希作为分析缓存的文件名，避免同名文件冲突
+    :param music_file: 音乐文件路径
+    :return: str
+    """
+    return cache_key_digest(music_file).hex()
+
+
+def pcm_cache_path(music_file: str) -> str:
+    """
+    获取音乐文件对应的解码缓存路径
+    :param music_file: 音乐文件路径
+    :return: str
+    """
+    return os.path.join(pcm_cache_dir(), track_cache_key(music_file) + ".pcm")
+
+
+def open_pcm(path: str, sourceSize: int = None, sourceMtime: float = None) -> tuple or None:
+    """
+    以内存映射方式打开解码缓存，源文件信息不一致时返回None
+    :param path: 缓存文件路径
+    :param sourceSize: 源文件大小
+    :param sourceMtime: 源文件修改时间
+    :return: (np.memmap, 采样率) or None
+    """
+    if os.path.isfile(path) is False:
+        return None
+    try:
+        with open(path, "rb") as rfp:
+            magic, version, channels, sampleRate, numSamples, size, mtime = HEADER.unpack(
+                rfp.read(HEADER.size)
+            )
+        if magic != PCM_MAGIC or version != PCM_VERSION or channels != 1:
+            return None
+        if (sourceSize is not None and size != sourceSize) or \
+                (sourceMtime is not None and mtime != sourceMtime):
+            return None
+        if numSamples == 0:
+            return np.zeros(0, dtype=np.int16), sampleRate
+        samples = np.memmap(path, dtype="<i2", mode="r", offset=PCM_HEADER_BYTES, shape=(numSamples,))
+        return samples, sampleRate
+    except (OSError, ValueError, struct.error) as e:
+        logger.error(f"读取解码缓存失败: {e}")
+        return None
+
+
+def decode_stream(music_file: str):
+    """
+    使用ffmpeg流式解码左声道为int16，按块产出原始字节，解码失败时抛出CalledProcessError
+    :param music_file: 音乐文件路径
+    :return: 字节块的生成器
+    """
+    cmd = [
+        tool_path("ffmpeg"),
+        "-v", "error",
+        "-i", music_file,
+        "-vn", "-af", "pan=mono|c0=c0",
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "-ar", str(PCM_SAMPLE_RATE),
+        "-",
+    ]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            chunk = process.stdout.read(READ_BYTES)
+            if not chunk:
+                break
+            yield chunk
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmd)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+
+def decode_to_cache(music_file: str, path: str, sourceSize: int, sourceMtime: float) -> None:
+    """
+    流式解码并写入缓存，不在内存中保留整首歌
+    :param music_file: 音乐文件路径
+    :param path: 缓存文件路径
+    :param sourceSize: 源文件大小
+    :param sourceMtime: 源文件修改时间
+    :return: None
+    """
+    temp = f"{path}.{os.getpid()}.tmp"  # 分析进程与界面可能同时写同一缓存
+    numBytes = 0
+    try:
+        with open(temp, "wb") as wfp:
+            wfp.write(b"\0" * PCM_HEADER_BYTES)
+            for chunk in decode_stream(music_file):
+                wfp.write(chunk)
+                numBytes += len(chunk)
+            wfp.seek(0)
+            wfp.write(HEADER.pack(
+                PCM_MAGIC, PCM_VERSION, 1, PCM_SAMPLE_RATE, numBytes // 2, sourceSize, sourceMtime
+            ))
+        os.replace(temp, path)
+    finally:
+        if os.path.isfile(temp):
+            os.remove(temp)
+
+
+def evict_pcm_cache(limit: int = MAX_CACHE_BYTES, keep: str = None) -> None:
+    """
+    按最近使用时间淘汰解码缓存，直到总大小不超过limit
+    :param limit: 总大小上限（字节）
+    :param keep: 不淘汰的缓存文件
+    :return: None
+    """
+    cache_dir = pcm_cache_dir()
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".pcm") is False:
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(entry[1] for entry in entries)
+    keep = os.path.abspath(keep) if keep is not None else None
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        if os.path.abspath(path) == keep:
+            continue
+        try:
+            os.remove(path)
+            logger.info(f"淘汰解码缓存：{path}")
+        except FileNotFoundError:
+            pass  # 已被其他进程淘汰
+        except OSError as e:
+            logger.error(f"淘汰解码缓存失败: {e}")
+            continue
+        total -= size
+
+
+def load_pcm(music_file: str) -> tuple:
+    """
+    获取音乐文件的左声道int16采样，命中缓存时直接内存映射，否则解码后写入缓存
+    :param music_file: 音乐文件路径
+    :return: (np.memmap, 采样率)
+    """
+    stat = os.stat(music_file)
+    path = pcm_cache_path(music_file)
+    result = open_pcm(path, stat.st_size, stat.st_mtime)
+    if result is not None:
+        os.utime(path)  # 以修改时间记录最近使用，用于LRU淘汰
+        logger.info(f"读取{music_file}的解码缓存")
+        return result
+
+    logger.info(f"解码{music_file}并写入缓存")
+    decode_to_cache(music_file, path, stat.st_size, stat.st_mtime)
+    evict_pcm_cache(keep=path)
+    return open_pcm(path)
+
+
+def read_pcm(music_file: str) -> tuple:
+    """
+    批量任务（指纹等）使用：命中缓存时直接内存映射但不更新最近使用时间，
+    未命中时解码到内存而不写入缓存，避免挤掉最近播放的曲目
+    :param music_file: 音乐文件路径
+    :return: (np.ndarray, 采样率)
+    """
+    stat = os.stat(music_file)
+    result = open_pcm(pcm_cache_path(music_file), stat.st_size, stat.st_mtime)
+    if result is not None:
+        return result
+    data = b"".join(decode_stream(music_file))
+    return np.frombuffer(data[:len(data) - len(data) % 2], dtype="<i2"), PCM_SAMPLE_RATE
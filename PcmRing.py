@@ -0,0 +1,390 @@
+import time
+import threading
+import subprocess
+import struct
+import numpy as np
+from loguru import logger
+from MediaTools import tool_path
+from Mixer import Mixer, DecoderSource
+
+HEADER_SLOTS = 8  # 头部 int64 槽位数量
+WRITE_POS = 0  # 解码线程已写入的帧数
+READ_POS = 1  # 输出端已读取的帧数
+EOF_FLAG = 2  # 解码结束标记
+STOP_FLAG = 3  # 请求解码线程退出
+SKIP_POS = 4  # 输出端直接跳到该帧：切换曲目时丢弃已解码但尚未送入ffplay的旧曲目
+BLOCK_FRAMES = 4096  # 每次读写的帧数
+# 估计的输出延迟（近似值，ffplay不报告实际播放位置）：
+# ffplay的读取线程在包队列超过25个包且时长超过1秒后才停止读取，另有约50毫秒的声卡缓冲与管道缓冲中的数据
+SINK_QUEUE_SECONDS = 1.05
+PIPE_BYTES = 65536
+
+
+class PcmRingBuffer:
+    """
+    进程内的 PCM 环形缓冲，解码线程、输出线程与可视化都在界面进程中，直接共用同一块numpy数组
+    单写者（解码线程）推进写游标，输出端推进读游标，两者均为头部的 int64，
+    写者在数据写完后才发布游标，读者无需加锁。
+    读游标之前保留 history 帧不被覆盖，供可视化读取刚刚播放过的数据。
+    """
+    def __init__(self, capacity: int, channels: int = 2, history: int = None):
+        """
+        :param capacity: 容量（帧）
+        :param channels: 声道数
+        :param history: 读游标之前保留的帧数，默认为容量的一半
+        """
+        self.capacity = capacity
+        self.channels = channels
+        self.history = capacity // 2 if history is None else history
+        self.header = np.zeros(HEADER_SLOTS, dtype=np.int64)
+        self.data = np.zeros((capacity, channels), dtype=np.int16)
+
+    @property
+    def write_pos(self) -> int:
+        return int(self.header[WRITE_POS])
+
+    @property
+    def read_pos(self) -> int:
+        return int(self.header[READ_POS])
+
+    @property
+    def eof(self) -> bool:
+        return bool(self.header[EOF_FLAG])
+
+    @property
+    def stopped(self) -> bool:
+        return bool(self.header[STOP_FLAG])
+
+    def request_stop(self) -> None:
+        """通知解码线程退出"""
+        self.header[STOP_FLAG] = 1
+
+    def write(self, frames: np.ndarray) -> bool:
+        """
+        写入帧，空间不足时等待输出端消费
+        :param frames: (n, channels) 的 int16 数组
+        :return: 收到退出请求时返回False
+        """
+        count = len(frames)
+        limit = self.capacity - self.history
+        while self.write_pos + count - self.read_pos > limit:
+            if self.stopped:
+                return False
+            time.sleep(0.005)
+
+        start = self.write_pos % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = frames[:first]
+        self.data[:count - first] = frames[first:]
+        self.header[WRITE_POS] = self.write_pos + count  # 数据就绪后再发布游标
+        return not self.stopped
+
+    def views(self, start: int, count: int) -> list:
+        """
+        获取 [start, start + count) 帧的零拷贝视图，跨越末尾时返回两段
+        :param start: 起始帧（绝对位置）
+        :param count: 帧数
+        :return: list[np.ndarray]
+        """
+        offset = start % self.capacity
+        first = min(count, self.capacity - offset)
+        if first == count:
+            return [self.data[offset:offset + count]]
+        return [self.data[offset:], self.data[:count - first]]
+
+    def window(self, start: int, count: int, channel: int = 0) -> np.ndarray:
+        """
+        读取单声道窗口，超出有效范围的部分补零
+        :param start: 起始帧（绝对位置）
+        :param count: 帧数
+        :param channel: 声道
+        :return: np.ndarray
+        """
+        oldest = max(self.read_pos - self.history, 0)
+        newest = self.write_pos
+        begin, end = max(start, oldest), min(start + count, newest)
+        result = np.zeros(count, dtype=np.int16)
+        if end > begin:
+            parts = [view[:, channel] for view in self.views(begin, end - begin)]
+            result[begin - start:end - start] = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        return result
+
+    def advance_read(self, count: int) -> None:
+        self.header[READ_POS] = self.read_pos + count
+
+    def close(self) -> None:
+        """释放缓冲，之后写入会立即返回"""
+        self.request_stop()
+        self.data = np.zeros((0, self.channels), dtype=np.int16)
+
+
+def wav_stream_header(sampleRate: int, channels: int) -> bytes:
+    """
+    长度未知的WAV头，ffplay据此识别采样率与声道，不依赖各版本不同的 -ch_layout / -ac 参数
+    :param sampleRate: 采样率
+    :param channels: 声道数
+    :return: bytes
+    """
+    unknown = 0xFFFFFFFF
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", unknown, b"WAVE",
+        b"fmt ", 16, 1, channels, sampleRate, sampleRate * channels * 2, channels * 2, 16,
+        b"data", unknown,
+    )
+
+
+class PcmStream:
+    """
+    单一输出的播放流
+    混音线程从 Mixer 读取当前曲目（以及排定的下一首）写入环形缓冲，输出线程把同一份数据送入ffplay，
+    可视化通过 window 以零拷贝视图读取当前正在播放的位置。
+    切换曲目（switch）和排定下一首（queue）只替换混音器的音源，ffplay一直运行，
+    下一首在当前曲目最后一帧之后无缝接上，不再有重启ffplay造成的空白和CPU峰值
+    """
+    def __init__(self, music_file: str, start_time: float = 0, sampleRate: int = 44100,
+                 channels: int = 2, seconds: float = 8):
+        """
+        :param music_file: 音乐文件路径
+        :param start_time: 开始播放的秒数
+        :param sampleRate: 输出采样率
+        :param channels: 输出声道数
+        :param seconds: 环形缓冲的时长（秒），保留的历史（一半）需大于输出延迟
+        """
+        self.music_file = music_file
+        self.start_time = start_time
+        self.sampleRate = sampleRate
+        self.channels = channels
+        self.ring = PcmRingBuffer(int(seconds * sampleRate), channels)
+        self.mixer = Mixer(sampleRate, channels)
+        self.lock = threading.Lock()  # 保护混音器，混音线程只在读取一块时持有
+        self.generation = 0  # 每次 switch 加一，混音线程据此丢弃旧曲目
+        self.starts = []  # (在环形缓冲中的起始帧, 文件路径, 起始秒数, 是否为 switch)，按播放顺序
+        self.queued = None  # 排定的下一首
+        self.mixerThread = None
+        self.sink = None
+        self.sinkThread = None
+        self.startedAt = None  # 第一块数据送入ffplay的时间
+        self.drainedAt = None  # 最后一块数据送入ffplay的时间
+        self.returncode = None
+
+    def sink_command(self) -> list:
+        return [
+            tool_path("ffplay"),
+            "-v", "error",
+            "-f", "wav",
+            "-nodisp", "-autoexit",
+            "-i", "-",
+        ]
+
+    def start(self) -> None:
+        """
+        启动ffmpeg、ffplay以及混音、输出两个线程
+        :return: None
+        """
+        logger.info(f"启动解码：{self.music_file}")
+        self.mixer.play(DecoderSource(self.music_file, self.sampleRate, self.channels, self.start_time))
+        self.mixerThread = threading.Thread(target=self._mix, daemon=True)
+        self.mixerThread.start()
+        self.sink = subprocess.Popen(
+            self.sink_command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        self.sinkThread = threading.Thread(target=self._pump, daemon=True)
+        self.sinkThread.start()
+
+    def switch(self, music_file: str, start_time: float = 0) -> None:
+        """
+        立即切换到另一首曲目，ffplay继续运行；原先排定的下一首一并丢弃
+        :param music_file: 音乐文件路径
+        :param start_time: 开始播放的秒数
+        :return: None
+        """
+        logger.info(f"切换解码：{music_file}")
+        source = DecoderSource(music_file, self.sampleRate, self.channels, start_time)
+        with self.lock:
+            if self.ring is None or self.ring.eof:
+                source.close()
+                return
+            self.mixer.play(source)
+            self.music_file, self.start_time = music_file, start_time
+            self.queued = None
+            self.generation += 1
+
+    def queue(self, music_file: str) -> None:
+        """
+        排定下一首，在当前曲目最后一帧之后无缝接上；已排定的下一首被替换
+        :param music_file: 音乐文件路径
+        :return: None
+        """
+        source = DecoderSource(music_file, self.sampleRate, self.channels)
+        with self.lock:
+            if self.ring is None or self.ring.eof:
+                source.close()
+                return
+            if self.mixer.current is None:
+                # 当前曲目已全部解码，直接接在已写入的数据之后
+                self.mixer.play(source)
+                self.starts.append((self.ring.write_pos, music_file, 0, False))
+            else:
+                self.mixer.queue(source)
+                self.queued = music_file
+
+    def _mix(self) -> None:
+        """混音线程：把混音器的输出写入环形缓冲，全部曲目播放完毕后结束"""
+        ring = self.ring
+        generation = None
+        try:
+            while ring.stopped is False:
+                with self.lock:
+                    if generation != self.generation:
+                        if generation is not None:
+                            ring.header[SKIP_POS] = ring.write_pos
+                            # 被跳过的部分中排定的曲目不会播放
+                            self.starts = [entry for entry in self.starts if entry[0] < ring.read_pos]
+                        generation = self.generation
+                        self.starts.append((ring.write_pos, self.music_file, self.start_time, True))
+                    # 混音器输出的帧全部写入环形缓冲，切换点的帧偏移即环形缓冲中的位置
+                    transitions = len(self.mixer.transitions)
+                    block = self.mixer.read(BLOCK_FRAMES)
+                    for frame in self.mixer.transitions[transitions:]:
+                        self.starts.append((frame, self.queued, 0, False))
+                        self.queued = None
+                    finished = self.mixer.current is None
+                if len(block):
+                    frames = (np.clip(block, -1, 32767 / 32768) * 32768).astype(np.int16)
+                    if ring.write(frames) is False:
+                        break
+                if finished:
+                    # 等输出端把缓冲送完再结束，期间仍可切换或排定下一首
+                    if ring.read_pos >= ring.write_pos:
+                        break
+                    time.sleep(0.005)
+        except (OSError, ValueError) as e:
+            logger.info(f"解码结束: {e}")
+        finally:
+            ring.header[EOF_FLAG] = 1
+            with self.lock:
+                self.mixer.close()
+
+    def _kill_decoders(self) -> None:
+        """结束混音器中的ffmpeg进程，让可能阻塞在读取上的混音线程返回"""
+        for source in (self.mixer.current, self.mixer.next):
+            process = getattr(source, "process", None)
+            if process is not None and process.poll() is None:
+                process.kill()
+
+    def _pump(self) -> None:
+        """把环形缓冲中的数据送入ffplay"""
+        ring = self.ring
+        try:
+            self.sink.stdin.write(wav_stream_header(self.sampleRate, self.channels))
+            while ring.stopped is False:
+                skip = int(ring.header[SKIP_POS]) - ring.read_pos
+                if skip > 0:
+                    ring.advance_read(skip)
+                available = ring.write_pos - ring.read_pos
+                if available <= 0:
+                    if ring.eof:
+                        break
+                    time.sleep(0.005)
+                    continue
+                count = min(available, BLOCK_FRAMES)
+                for view in ring.views(ring.read_pos, count):
+                    self.sink.stdin.write(view.data)
+                if self.startedAt is None:
+                    self.startedAt = time.monotonic()
+                ring.advance_read(count)
+            self.drainedAt = time.monotonic()
+            self.sink.stdin.close()
+        except (OSError, ValueError) as e:
+            logger.info(f"音频输出结束: {e}")
+
+    def position(self) -> int:
+        """
+        当前正在播放的帧（环形缓冲中的绝对位置），为近似值。
+        ffplay只在自身缓冲有空间时读取管道，送入的帧数减去估计的管道与ffplay缓冲中的帧数
+        （SINK_QUEUE_SECONDS、PIPE_BYTES）即为正在播放的位置，误差取决于声卡缓冲；
+        全部送完后缓冲中的数据按实际时间继续播放
+        :return: int
+        """
+        if self.startedAt is None or self.ring is None:
+            return 0
+        consumed = self.ring.read_pos
+        latency = int(SINK_QUEUE_SECONDS * self.sampleRate) + PIPE_BYTES // (self.channels * 2)
+        if self.drainedAt is not None:
+            return min(consumed, consumed - latency + int((time.monotonic() - self.drainedAt) * self.sampleRate))
+        return max(consumed - latency, 0)
+
+    def current_track(self) -> tuple:
+        """
+        正在播放的曲目与其播放到的秒数，混音器接上下一首后随实际输出切换；
+        switch 之后ffplay缓冲中剩余的原曲目不再计入，直接按新曲目的起点报告
+        :return: (文件路径, 秒)
+        """
+        position = self.position()
+        path, seconds = self.music_file, self.start_time
+        for frame, startPath, startTime, switched in list(self.starts):
+            if frame > position:
+                if switched:
+                    path, seconds = startPath, startTime
+                break
+            path, seconds = startPath, startTime + (position - frame) / self.sampleRate
+        return path, seconds
+
+    def window(self, count: int, channel: int = 0) -> np.ndarray:
+        """
+        读取以当前播放位置为中心的单声道窗口
+        :param count: 帧数
+        :param channel: 声道
+        :return: np.ndarray
+        """
+        if self.ring is None:
+            return np.zeros(count, dtype=np.int16)
+        return self.ring.window(self.position() - count // 2, count, channel)
+
+    def poll(self) -> int or None:
+        """与 subprocess.Popen.poll 一致：播放中返回None"""
+        if self.returncode is not None:
+            return self.returncode
+        if self.sink is not None and self.sink.poll() is not None:
+            self.returncode = self.sink.returncode
+            self.release()
+        return self.returncode
+
+    def terminate(self) -> None:
+        """停止解码与输出，已结束或已释放时不做任何事"""
+        if self.ring is None:
+            return
+        self.ring.request_stop()
+        if self.sink is not None and self.sink.poll() is None:
+            self.sink.terminate()
+        self._kill_decoders()
+        if self.mixerThread is not None:
+            self.mixerThread.join(timeout=1)
+
+    def wait(self) -> int:
+        if self.ring is None:
+            return self.returncode
+        if self.sink is not None:
+            self.sink.wait()
+        if self.sinkThread is not None:
+            self.sinkThread.join(timeout=1)
+        self.returncode = self.sink.returncode if self.sink is not None else 0
+        self.release()
+        return self.returncode
+
+    def release(self) -> None:
+        """混音线程退出后释放环形缓冲"""
+        if self.ring is None:
+            return
+        self.ring.request_stop()
+        self._kill_decoders()
+        if self.mixerThread is not None:
+            self.mixerThread.join(timeout=1)
+        if self.sinkThread is not None:
+            self.sinkThread.join(timeout=1)
+        self.ring.close()
+        self.ring = None
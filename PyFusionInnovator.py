@@ -13,6 +13,7 @@ from PyQt5.QtWidgets import (
 )
 from PyQt5.QtCore import QSize
 from loguru import logger
+from Session import load_session, save_session
 
 PATH = os.path.split(__file__)[0]
 
@@ -109,8 +110,31 @@ class MainWindow(QMainWindow):
 
         # 记录最后一个选中的按钮
         self.last_selected_button = None
+        self.menuButtons = {
+            button.text(): button for button in (musicLeftButton, videoLeftButton, imageLeftButton)
+        }
+        self.restoreSession()
         logger.info("成功初始化主窗口")
 
+    def restoreSession(self) -> None:
+        """
+        按会话快照恢复窗口位置和上次打开的页面
+        :return: None
+        """
+        snapshot = load_session("mainWindow")
+        if snapshot.get("geometry"):
+            self.setGeometry(*snapshot["geometry"])
+        if snapshot.get("page") in self.menuButtons:
+            self.setLastSelectedButton(self.menuButtons[snapshot["page"]])
+
+    def closeEvent(self, event) -> None:
+        geometry = self.normalGeometry() if self.isMaximized() else self.geometry()
+        save_session("mainWindow", {
+            "geometry": [geometry.x(), geometry.y(), geometry.width(), geometry.height()],
+            "page": self.last_selected_button.text() if self.last_selected_button else None,
+        })
+        super().closeEvent(event)
+
     def setLastSelectedButton(self, button) -> None:
         """
         设置左侧按钮的样式及切换窗口
@@ -0,0 +1,71 @@
+import os
+import json
+from loguru import logger
+
+PATH = os.path.split(__file__)[0]
+
+SESSION_VERSION = 2
+
+
+def session_path() -> str:
+    cache_dir = os.path.join(PATH, "cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, "Session.json")
+
+
+def load_session(section: str = None) -> dict:
+    """
+    读取会话快照
+    :param section: 只返回某一部分，如 "mainWindow"、"player"
+    :return: dict
+    """
+    path = session_path()
+    result = {}
+    if os.path.isfile(path):
+        try:
+            with open(path, mode="r", encoding="utf-8") as rfp:
+                result = json.loads(rfp.read())
+        except (OSError, ValueError) as e:
+            logger.error(f"读取会话快照失败: {e}")
+            result = {}
+    if result.get("version") != SESSION_VERSION:
+        result = {}
+    if section is not None:
+        return result.get(section) or {}
+    return result
+
+
+def save_session(section: str, value: dict) -> None:
+    """
+    写入会话快照的某一部分，其余部分保持不变
+    :param section: 部分名称
+    :param value: 数据
+    :return: None
+    """
+    result = load_session()
+    result["version"] = SESSION_VERSION
+    result[section] = value
+    path = session_path()
+    with open(path + ".tmp", mode="w+", encoding="utf-8") as wfp:
+        wfp.write(json.dumps(result, indent=4, ensure_ascii=False))
+    os.replace(path + ".tmp", path)
+    logger.info(f"保存会话快照：{section}")
+
+
+def track_snapshot(snapshot: dict, music_file: str) -> dict:
+    """
+    若快照记录的是同一个未修改过的文件，返回其中的曲目信息，否则返回空字典
+    :param snapshot: 播放器快照
+    :param music_file: 音乐文件路径
+    :return: dict
+    """
+    track = snapshot.get("track") or {}
+    if track.get("path") != os.path.abspath(music_file):
+        return {}
+    try:
+        stat = os.stat(music_file)
+    except OSError:
+        return {}
+    if track.get("size") != stat.st_size or track.get("mtime") != stat.st_mtime:
+        return {}
+    return track
@@ -0,0 +1,70 @@
+import numpy as np
+
+COLOR_GRADE = ['blue', 'yellow', 'red']
+# 与 matplotlib 颜色名对应的RGB，用于离线渲染
+COLOR_RGB = {
+    'blue': (0, 0, 255),
+    'yellow': (255, 255, 0),
+    'red': (255, 0, 0),
+}
+SAMPLE_SCALE = 30000  # int16 采样的归一化系数
+
+
+def window_size(sampleRate: int) -> int:
+    """每帧对应20ms的采样"""
+    return int(0.02 * sampleRate)
+
+
+def spectrum(y: np.ndarray, splitWindow: int) -> np.ndarray:
+    """
+    计算一帧的频谱幅度
+    :param y: 归一化后的采样窗口
+    :param splitWindow: 保留的频点数
+    :return: np.ndarray
+    """
+    return np.abs(np.fft.fft(y)) / splitWindow
+
+
+def spectrum_grade(yft: np.ndarray) -> int:
+    """
+    频谱起伏等级，对应 COLOR_GRADE 的下标
+    :param yft: 一帧频谱
+    :return: int
+    """
+    return int(max(yft) - min(yft))
+
+
+def grade_color(yft: np.ndarray) -> str:
+    """
+    根据频谱起伏选择颜色，超出范围时为蓝色
+    :param yft: 一帧频谱
+    :return: str
+    """
+    grade = spectrum_grade(yft)
+    if 0 <= grade < len(COLOR_GRADE):
+        return COLOR_GRADE[grade]
+    return "blue"
+
+
+def spectrum_frames(samples: np.ndarray, sampleRate: int, first: int, count: int) -> np.ndarray:
+    """
+    一次性计算连续多帧的频谱，第i帧以 (first + i) * windowSize 为起点，
+    与实时可视化一样向前后各扩展一个窗口
+    :param samples: int16 单声道采样
+    :param sampleRate: 采样率
+    :param first: 第一帧序号
+    :param count: 帧数
+    :return: (count, splitWindow) 的频谱
+    """
+    windowSize = window_size(sampleRate)
+    splitWindow = windowSize // 8
+    begin = first * windowSize - windowSize
+    end = (first + count) * windowSize + 2 * windowSize
+    block = np.zeros(end - begin, dtype=np.float32)
+    left, right = max(begin, 0), min(end, len(samples))
+    if right > left:
+        block[left - begin:right - begin] = samples[left:right]
+    block /= SAMPLE_SCALE
+
+    frames = np.lib.stride_tricks.sliding_window_view(block, 3 * windowSize)[::windowSize][:count]
+    return (np.abs(np.fft.fft(frames, axis=1)) / splitWindow)[:, :splitWindow]
@@ -0,0 +1,158 @@
+import os
+import sys
+import hashlib
+from array import array
+import numpy as np
+
+# 内存目标：TrackTable 每首曲目的定长列不超过 TABLE_BYTES_PER_TRACK 字节（当前为59字节），
+# 路径与标题字符串另计（ASCII 字符串约 49 + 长度 字节）。
+# 基准：20万首、路径约45字符时整张表约 43MB，即每首约 215 字节，nbytes() 与 string_bytes() 可用于复核，
+# tests/test_track_model.py 检查定长列不超过该目标。
+# 单独的 Track 对象本身80字节，加上字段值约 350 字节，只用于播放队列等少量曲目。
+TABLE_BYTES_PER_TRACK = 64
+CACHE_KEY_BYTES = 10  # track_cache_key 的20位十六进制对应10字节
+
+
+def cache_key_digest(path: str) -> bytes:
+    """
+    与 PcmCache.track_cache_key 相同的键，以二进制保存
+    :param path: 文件路径
+    :return: bytes
+    """
+    return hashlib.sha1(os.path.abspath(path).encode("utf-8")).digest()[:CACHE_KEY_BYTES]
+
+
+class Track:
+    """单首曲目的紧凑记录，用于播放队列和会话快照"""
+    __slots__ = ("path", "duration", "sampleRate", "gain", "position", "cacheKey")
+
+    def __init__(self, path: str, duration: float = 0.0, sampleRate: int = 0, gain: float = 0.0,
+                 position: float = 0.0, cacheKey: str = None):
+        """
+        :param path: 文件绝对路径
+        :param duration: 时长（秒），未知时为0
+        :param sampleRate: 采样率，未知时为0
+        :param gain: 回放增益（dB）
+        :param position: 播放位置（秒）
+        :param cacheKey: 分析缓存的键
+        """
+        self.path = os.path.abspath(path)
+        self.duration = duration
+        self.sampleRate = sampleRate
+        self.gain = gain
+        self.position = position
+        self.cacheKey = cacheKey or cache_key_digest(self.path).hex()
+
+    def __repr__(self) -> str:
+        return f"Track({self.path!r}, duration={self.duration}, position={self.position})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Track) and other.path == self.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, value: dict) -> "Track":
+        return cls(**{name: value[name] for name in cls.__slots__ if name in value})
+
+
+class TrackTable:
+    """
+    按列存储的曲目表，行号即文档号。
+    数值列使用 array 模块逐行追加，批量计算时用 column() 取得零拷贝的 numpy 视图；
+    删除的行只做标记，路径置为None，compact() 时才真正去掉并重新编号。
+    """
+    def __init__(self):
+        self.paths = []  # 行号 -> 路径，删除后为None
+        self.titles = []  # 行号 -> 显示名称
+        self.durations = array("f")
+        self.sampleRates = array("I")
+        self.gains = array("f")
+        self.positions = array("f")
+        self.sizes = array("q")  # 文件大小
+        self.mtimes = array("d")  # 修改时间
+        self.cacheKeys = bytearray()  # 每行 CACHE_KEY_BYTES 字节
+        self.alive = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def append(self, path: str, metadata: dict) -> int:
+        """
+        追加一行
+        :param path: 文件路径
+        :param metadata: 元数据，可包含 title/duration/sampleRate/gain/size/mtime
+        :return: 行号
+        """
+        row = len(self.paths)
+        self.paths.append(path)
+        self.titles.append(metadata.get("title") or os.path.splitext(os.path.basename(path))[0])
+        self.durations.append(metadata.get("duration") or 0.0)
+        self.sampleRates.append(metadata.get("sampleRate") or 0)
+        self.gains.append(metadata.get("gain") or 0.0)
+        self.positions.append(0.0)
+        self.sizes.append(metadata.get("size") or 0)
+        self.mtimes.append(metadata.get("mtime") or 0.0)
+        self.cacheKeys += cache_key_digest(path)
+        self.alive.append(1)
+        return row
+
+    def remove(self, row: int) -> None:
+        self.alive[row] = 0
+        self.paths[row] = None
+
+    def compact(self) -> np.ndarray:
+        """
+        去掉已删除的行，剩余的行保持原顺序重新编号
+        :return: 旧行号 -> 新行号 的数组，已删除的行为-1
+        """
+        rows = np.flatnonzero(self.column("alive") == 1)
+        mapping = np.full(len(self.paths), -1, dtype=np.int64)
+        mapping[rows] = np.arange(len(rows))
+        self.paths = [self.paths[row] for row in rows]
+        self.titles = [self.titles[row] for row in rows]
+        for name in ("durations", "sampleRates", "gains", "positions", "sizes", "mtimes"):
+            setattr(self, name, array(getattr(self, name).typecode, self.column(name)[rows].tobytes()))
+        keys = np.frombuffer(self.cacheKeys, dtype=np.uint8).reshape(-1, CACHE_KEY_BYTES)
+        self.cacheKeys = bytearray(keys[rows].tobytes())
+        self.alive = bytearray(b"\x01" * len(rows))
+        return mapping
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        获取某一列的numpy视图，如 column("durations").sum() 统计总时长
+        :param name: 列名
+        :return: np.ndarray
+        """
+        value = getattr(self, name)
+        if isinstance(value, bytearray):
+            return np.frombuffer(value, dtype=np.uint8)
+        return np.frombuffer(value, dtype=value.typecode)
+
+    def cache_key(self, row: int) -> str:
+        return self.cacheKeys[row * CACHE_KEY_BYTES:(row + 1) * CACHE_KEY_BYTES].hex()
+
+    def record(self, row: int) -> Track:
+        """
+        取出一行作为 Track
+        :param row: 行号
+        :return: Track
+        """
+        return Track(
+            self.paths[row], float(self.durations[row]), int(self.sampleRates[row]),
+            float(self.gains[row]), float(self.positions[row]), self.cache_key(row)
+        )
+
+    def nbytes(self) -> int:
+        """定长列占用的字节数，不含路径与标题字符串"""
+        columns = (self.durations, self.sampleRates, self.gains, self.positions, self.sizes, self.mtimes)
+        return sum(len(column) * column.itemsize for column in columns) \
+            + len(self.cacheKeys) + len(self.alive) + 2 * len(self.paths) * 8
+
+    def string_bytes(self) -> int:
+        """路径与标题字符串占用的字节数"""
+        return sum(sys.getsizeof(value) for value in self.paths + self.titles if value is not None)
@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from loguru import logger
+from MediaTools import MediaToolService, media_tools
+
+AUDIO_EXTENSIONS = (".mp3", ".flac", ".wav", ".ogg", ".opus", ".m4a", ".aac", ".wma", ".ape", ".aiff")
+PLAYLIST_EXTENSIONS = (".m3u", ".m3u8")
+# 按采样位宽选择的PCM编码
+PCM_CODECS = {
+    "wav": {1: "pcm_u8", 2: "pcm_s16le", 3: "pcm_s24le", 4: "pcm_s32le"},
+    "aiff": {1: "pcm_s8", 2: "pcm_s16be", 3: "pcm_s24be", 4: "pcm_s32be"},
+}
+FLAC_SAMPLE_FMT = {1: "s16", 2: "s16", 3: "s32", 4: "s32"}
+
+
+def read_playlist(playlist: str) -> list:
+    """
+    读取m3u播放列表，相对路径以播放列表所在目录为基准
+    :param playlist: 播放列表路径
+    :return: list
+    """
+    root = os.path.dirname(os.path.abspath(playlist))
+    result = []
+    with open(playlist, mode="r", encoding="utf-8-sig") as rfp:
+        for line in rfp:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            result.append(os.path.normpath(os.path.join(root, line)))
+    return result
+
+
+def collect_sources(source: str) -> tuple:
+    """
+    收集要转换的音频文件
+    :param source: 文件夹、播放列表或单个文件
+    :return: (文件列表, 用于保持目录结构的根目录)
+    """
+    if os.path.isdir(source):
+        files = []
+        for dirpath, _, filenames in os.walk(source):
+            for name in sorted(filenames):
+                if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                    files.append(os.path.join(dirpath, name))
+        return files, source
+    if os.path.splitext(source)[1].lower() in PLAYLIST_EXTENSIONS:
+        return read_playlist(source), None
+    return [source], None
+
+
+def output_path(source: str, fmt: str, out_dir: str = None, root: str = None) -> str:
+    """
+    生成输出路径，只替换真正的扩展名
+    :param source: 源文件
+    :param fmt: 目标格式
+    :param out_dir: 输出目录，为None时输出到源文件旁
+    :param root: 源文件夹，用于在输出目录中保持子目录结构
+    :return: str
+    """
+    stem = os.path.splitext(source)[0]
+    if out_dir is None:
+        return f"{stem}.{fmt}"
+    relative = os.path.relpath(stem, root) if root else os.path.basename(stem)
+    return os.path.join(out_dir, f"{relative}.{fmt}")
+
+
+def is_up_to_date(source: str, target: str) -> bool:
+    """
+    输出文件存在且不早于源文件时视为最新
+    :param source: 源文件
+    :param target: 输出文件
+    :return: bool
+    """
+    try:
+        target_stat = os.stat(target)
+    except OSError:
+        return False
+    return target_stat.st_size > 0 and target_stat.st_mtime >= os.stat(source).st_mtime
+
+
+def transcode_file(source: str, target: str, fmt: str = "wav", sampleRate: int = 44100,
+                   sampleWidth: int = 2, timeout: float = None, service: MediaToolService = None) -> float:
+    """
+    通过ffmpeg流式转换单个文件，不在内存中解码整首歌
+    :param source: 源文件
+    :param target: 输出文件
+    :param fmt: 目标格式
+    :param sampleRate: 采样率
+    :param sampleWidth: 采样位宽（字节）
+    :param timeout: 超时时间（秒）
+    :param service: 运行ffmpeg的MediaToolService，默认为全局服务
+    :return: 转换的音频时长（秒）
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    cmd = [
+        "-v", "error", "-nostats", "-progress", "pipe:1",
+        "-y", "-i", source,
+        "-vn", "-ar", str(sampleRate),
+    ]
+    if fmt in PCM_CODECS:
+        cmd += ["-acodec", PCM_CODECS[fmt][sampleWidth]]
+    elif fmt == "flac":
+        cmd += ["-sample_fmt", FLAC_SAMPLE_FMT[sampleWidth]]
+    temp = f"{os.path.splitext(target)[0]}.part.{fmt}"
+    cmd.append(temp)
+
+    try:
+        result = (service or media_tools()).run("ffmpeg", cmd, timeout)
+        os.replace(temp, target)
+    finally:
+        if os.path.isfile(temp):
+            os.remove(temp)
+
+    # -progress 输出中最后一个 out_time_us 即为转换的音频时长
+    seconds = 0.0
+    for line in result.stdout.splitlines():
+        if line.startswith("out_time_us="):
+            try:
+                seconds = int(line.split("=", 1)[1]) / 1000000
+            except ValueError:
+                pass
+    return seconds
+
+
+def transcode_batch(source: str, fmt: str = "wav", out_dir: str = None, sampleRate: int = 44100,
+                    sampleWidth: int = 2, jobs: int = None, force: bool = False) -> dict:
+    """
+    并行批量转换文件夹或播放列表，每个任务是独立的ffmpeg进程，可占满多个核心
+    :param source: 文件夹、播放列表或单个文件
+    :param fmt: 目标格式
+    :param out_dir: 输出目录，为None时输出到源文件旁
+    :param sampleRate: 采样率
+    :param sampleWidth: 采样位宽（字节）
+    :param jobs: 并行任务数，默认为CPU核心数
+    :param force: 是否忽略已是最新的输出
+    :return: 统计信息
+    """
+    files, root = collect_sources(source)
+    jobs = jobs or os.cpu_count() or 1
+    report = {
+        "files": 0, "skipped": 0, "failed": [],
+        "audioSeconds": 0.0, "elapsed": 0.0,
+        "filesPerSecond": 0.0, "audioSecondsPerSecond": 0.0,
+    }
+
+    tasks = []
+    for file in files:
+        target = output_path(file, fmt, out_dir, root)
+        if os.path.abspath(target) == os.path.abspath(file):
+            report["skipped"] += 1
+            continue
+        if force is False and is_up_to_date(file, target):
+            report["skipped"] += 1
+            continue
+        tasks.append((file, target))
+
+    logger.info(f"开始批量转换：{len(tasks)}个文件，跳过{report['skipped']}个，并行数{jobs}")
+    start = time.perf_counter()
+    service = MediaToolService(jobs)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(transcode_file, file, target, fmt, sampleRate, sampleWidth, None, service): file
+            for file, target in tasks
+        }
+        for future in as_completed(futures):
+            file = futures[future]
+            try:
+                report["audioSeconds"] += future.result()
+                report["files"] += 1
+            except (OSError, subprocess.SubprocessError) as e:
+                logger.error(f"转换{file}失败: {e}")
+                report["failed"].append(file)
+    service.shutdown()
+
+    elapsed = time.perf_counter() - start
+    report["elapsed"] = elapsed
+    if elapsed > 0:
+        report["filesPerSecond"] = report["files"] / elapsed
+        report["audioSecondsPerSecond"] = report["audioSeconds"] / elapsed
+    logger.info(
+        f"转换完成：{report['files']}个文件，用时{elapsed:.2f}s，"
+        f"{report['filesPerSecond']:.2f} 文件/s，{report['audioSecondsPerSecond']:.1f} 音频秒/s"
+    )
+    return report
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="批量转换音频格式")
+    parser.add_argument("source", help="文件夹、m3u播放列表或单个文件")
+    parser.add_argument("-f", "--format", default="wav", help="目标格式，默认wav")
+    parser.add_argument("-o", "--out-dir", default=None, help="输出目录，默认输出到源文件旁")
+    parser.add_argument("-r", "--rate", type=int, default=44100, help="采样率")
+    parser.add_argument("-w", "--width", type=int, default=2, choices=(1, 2, 3, 4), help="采样位宽（字节）")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="并行任务数，默认为CPU核心数")
+    parser.add_argument("--force", action="store_true", help="重新转换已是最新的文件")
+    args = parser.parse_args(argv)
+
+    report = transcode_batch(
+        args.source, args.format, args.out_dir, args.rate, args.width, args.jobs, args.force
+    )
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from loguru import logger
+from MediaTools import tool_path
+from PcmCache import load_pcm, open_pcm, pcm_cache_path
+from Spectrum import COLOR_RGB, spectrum_frames, grade_color, window_size
+
+BACKGROUND = np.array([255, 255, 255], dtype=np.uint8)
+Y_LIMIT = 2  # 与实时可视化的 ax1.set_ylim(0, 2) 一致
+CHUNK_FRAMES = 25  # 每个进程任务渲染的帧数，720p时约70MB
+
+
+def rasterize(yfts: np.ndarray, width: int, height: int) -> bytes:
+    """
+    把多帧频谱光栅化为RGB24原始图像，画法与实时可视化相同：半透明填充加曲线
+    :param yfts: (n, splitWindow) 的频谱
+    :param width: 视频宽度
+    :param height: 视频高度
+    :return: bytes
+    """
+    frames = np.empty((len(yfts), height, width, 3), dtype=np.uint8)
+    frames[:] = BACKGROUND
+    bins = np.arange(yfts.shape[1])
+    columns = np.linspace(0, yfts.shape[1] - 1, width)
+    rows = np.arange(height, dtype=np.float32)[:, None]
+
+    for frame, yft in zip(frames, yfts):
+        heights = np.interp(columns, bins, yft)
+        top = (height - np.clip(heights / Y_LIMIT, 0, 1) * height).astype(np.float32)[None, :]
+        color = np.array(COLOR_RGB[grade_color(yft)], dtype=np.uint16)
+        frame[rows >= top] = ((color + BACKGROUND) // 2).astype(np.uint8)  # alpha=0.5
+        frame[np.abs(rows - top) < 1] = color.astype(np.uint8)
+    return frames.tobytes()
+
+
+def _render_chunk(cache_file: str, first: int, count: int, width: int, height: int) -> bytes:
+    """
+    进程池任务：从内存映射的解码缓存计算并光栅化一段帧
+    :param cache_file: 解码缓存路径
+    :param first: 第一帧序号
+    :param count: 帧数
+    :param width: 视频宽度
+    :param height: 视频高度
+    :return: bytes
+    """
+    samples, sampleRate = open_pcm(cache_file)
+    return rasterize(spectrum_frames(samples, sampleRate, first, count), width, height)
+
+
+def render_video(music_file: str, output: str, width: int = 1280, height: int = 720,
+                 jobs: int = None) -> dict:
+    """
+    无界面渲染频谱动画并与原音频合成为MP4，不依赖QTimer和窗口
+    :param music_file: 音乐文件路径
+    :param output: 输出视频路径
+    :param width: 视频宽度
+    :param height: 视频高度
+    :param jobs: 渲染进程数，默认为CPU核心数
+    :return: 统计信息
+    """
+    samples, sampleRate = load_pcm(music_file)
+    cache_file = pcm_cache_path(music_file)
+    windowSize = window_size(sampleRate)
+    totalFrames = -(-len(samples) // windowSize)
+    duration = len(samples) / sampleRate
+    jobs = jobs or os.cpu_count() or 1
+
+    cmd = [
+        tool_path("ffmpeg"),
+        "-v", "error", "-y",
+        "-f", "rawvideo", "-pix_fmt", "rgb24",
+        "-s", f"{width}x{height}",
+        "-r", f"{sampleRate}/{windowSize}",  # 每帧对应一个窗口，44100Hz时为50fps
+        "-i", "-",
+        "-i", music_file,
+        "-map", "0:v", "-map", "1:a",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest",
+        output,
+    ]
+    logger.info(f"开始渲染{music_file}：{totalFrames}帧，进程数{jobs}")
+    start = time.perf_counter()
+    encoder = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    completed = False
+    try:
+        try:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                pending = deque()
+                try:
+                    # 只保留有限的在途任务，按顺序写入编码器，内存占用与视频长度无关
+                    for first in range(0, totalFrames, CHUNK_FRAMES):
+                        pending.append(executor.submit(
+                            _render_chunk, cache_file, first, min(CHUNK_FRAMES, totalFrames - first), width, height
+                        ))
+                        if len(pending) > jobs:
+                            encoder.stdin.write(pending.popleft().result())
+                    while pending:
+                        encoder.stdin.write(pending.popleft().result())
+                except BaseException:
+                    # 不再等待剩余的分块
+                    for future in pending:
+                        future.cancel()
+                    raise
+        except BrokenPipeError:
+            logger.error("视频编码器提前退出")
+        # communicate 会关闭stdin并等待编码结束
+        _, error = encoder.communicate()
+        if encoder.returncode != 0:
+            raise subprocess.CalledProcessError(encoder.returncode, cmd, stderr=error)
+        completed = True
+    finally:
+        if completed is False:
+            # 渲染进程出错、编码失败或被中断：结束编码器并删除不完整的视频
+            if encoder.poll() is None:
+                encoder.kill()
+            encoder.wait()
+            for pipe in (encoder.stdin, encoder.stderr):
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+            if os.path.exists(output):
+                os.remove(output)
+
+    elapsed = time.perf_counter() - start
+    report = {
+        "frames": totalFrames,
+        "audioSeconds": duration,
+        "elapsed": elapsed,
+        "speed": duration / elapsed if elapsed > 0 else 0.0,
+    }
+    logger.info(f"渲染完成：用时{elapsed:.2f}s，{report['speed']:.1f}倍实时速度")
+    return report
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="离线渲染音乐频谱视频")
+    parser.add_argument("music", help="音乐文件")
+    parser.add_argument("output", help="输出的MP4文件")
+    parser.add_argument("--width", type=int, default=1280, help="视频宽度")
+    parser.add_argument("--height", type=int, default=720, help="视频高度")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="渲染进程数，默认为CPU核心数")
+    args = parser.parse_args(argv)
+
+    render_video(args.music, args.output, args.width, args.height, args.jobs)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+import os
+import struct
+import numpy as np
+from loguru import logger
+from PcmCache import track_cache_key
+
+PATH = os.path.split(__file__)[0]
+
+PEAKS_MAGIC = b"PFPK"
+PEAKS_VERSION = 1
+BASE_BLOCK = 256  # 第0层每个块包含的采样数
+CHUNK_BLOCKS = 16384  # 构建第0层时每次处理的块数，限制临时内存
+# magic, 版本, 层数, 采样率, 第0层块大小, 采样总数, 源文件大小, 源文件修改时间
+HEADER = struct.Struct("<4sHHIIQQd")
+
+
+class PeakPyramid:
+    """
+    多分辨率波形峰值金字塔
+    每一层为 (n, 3) 的 int16 数组，列依次为 最小值、最大值、RMS，
+    第 k 层每个块覆盖 BASE_BLOCK * 2**k 个采样
+    """
+    def __init__(self, levels: list, sampleRate: int, baseBlock: int, numSamples: int):
+        """
+        :param levels: 每层的峰值数组
+        :param sampleRate: 采样率
+        :param baseBlock: 第0层块大小
+        :param numSamples: 采样总数
+        """
+        self.levels = levels
+        self.sampleRate = sampleRate
+        self.baseBlock = baseBlock
+        self.numSamples = numSamples
+
+    def level_for_width(self, width: int) -> int:
+        """
+        选择块数不少于像素宽度的最粗一层
+        :param width: 像素宽度
+        :return: int
+        """
+        for index in range(len(self.levels) - 1, -1, -1):
+            if len(self.levels[index]) >= width:
+                return index
+        return 0
+
+    def columns(self, width: int) -> tuple:
+        """
+        将波形压缩为指定像素宽度的列，数值范围为 -1 ~ 1
+        :param width: 像素宽度
+        :return: (mins, maxs, rms)
+        """
+        width = max(int(width), 1)
+        level = self.levels[self.level_for_width(width)]
+        count = len(level)
+        if count == 0:
+            empty = np.zeros(width, dtype=np.float32)
+            return empty, empty, empty
+
+        if count >= width:
+            edges = (np.arange(width, dtype=np.int64) * count) // width
+            mins = np.minimum.reduceat(level[:, 0], edges)
+            maxs = np.maximum.reduceat(level[:, 1], edges)
+            squares = np.add.reduceat(level[:, 2].astype(np.float64) ** 2, edges)
+            rms = np.sqrt(squares / np.diff(np.append(edges, count)))
+        else:
+            # 音频过短时直接拉伸第0层
+            index = np.linspace(0, count - 1, width).astype(np.int64)
+            mins, maxs, rms = level[index, 0], level[index, 1], level[index, 2]
+
+        scale = np.float32(1 / 32768)
+        return (
+            mins.astype(np.float32) * scale,
+            maxs.astype(np.float32) * scale,
+            rms.astype(np.float32) * scale,
+        )
+
+
+def build_peaks(samples: np.ndarray, sampleRate: int, baseBlock: int = BASE_BLOCK) -> PeakPyramid:
+    """
+    单次向量化遍历构建峰值金字塔
+    :param samples: int16 单声道采样
+    :param sampleRate: 采样率
+    :param baseBlock: 第0层块大小
+    :return: PeakPyramid
+    """
+    numSamples = len(samples)
+    numBlocks = max(-(-numSamples // baseBlock), 1)
+    level = np.empty((numBlocks, 3), dtype=np.int16)
+
+    # 分段计算第0层，避免为整首歌创建浮点副本
+    step = CHUNK_BLOCKS * baseBlock
+    for block, start in enumerate(range(0, max(numSamples, 1), step)):
+        chunk = np.asarray(samples[start:start + step], dtype=np.int16)
+        pad = -len(chunk) % baseBlock
+        if pad or len(chunk) == 0:
+            chunk = np.concatenate([chunk, np.zeros(pad or baseBlock, dtype=np.int16)])
+        blocks = chunk.reshape(-1, baseBlock)
+        rows = slice(block * CHUNK_BLOCKS, block * CHUNK_BLOCKS + len(blocks))
+        level[rows, 0] = blocks.min(axis=1)
+        level[rows, 1] = blocks.max(axis=1)
+        power = np.einsum("ij,ij->i", blocks.astype(np.float32), blocks.astype(np.float32)) / baseBlock
+        level[rows, 2] = np.minimum(np.sqrt(power), 32767)
+
+    levels = [level]
+    while len(level) > 1:
+        if len(level) % 2:
+            level = np.concatenate([level, level[-1:]])
+        pairs = level.reshape(-1, 2, 3)
+        nextLevel = np.empty((len(pairs), 3), dtype=np.int16)
+        nextLevel[:, 0] = pairs[:, :, 0].min(axis=1)
+        nextLevel[:, 1] = pairs[:, :, 1].max(axis=1)
+        nextLevel[:, 2] = np.sqrt((pairs[:, :, 2].astype(np.float32) ** 2).mean(axis=1))
+        levels.append(nextLevel)
+        level = nextLevel
+
+    return PeakPyramid(levels, sampleRate, baseBlock, numSamples)
+
+
+def save_peaks(pyramid: PeakPyramid, path: str, sourceSize: int = 0, sourceMtime: float = 0.0) -> None:
+    """
+    将峰值金字塔写入缓存文件
+    :param pyramid: PeakPyramid
+    :param path: 缓存文件路径
+    :param sourceSize: 源文件大小，用于校验缓存
+    :param sourceMtime: 源文件修改时间，用于校验缓存
+    :return: None
+    """
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "wb") as wfp:
+        wfp.write(HEADER.pack(
+            PEAKS_MAGIC, PEAKS_VERSION, len(pyramid.levels),
+            pyramid.sampleRate, pyramid.baseBlock, pyramid.numSamples,
+            sourceSize, sourceMtime
+        ))
+        wfp.write(np.array([len(level) for level in pyramid.levels], dtype="<u8").tobytes())
+        for level in pyramid.levels:
+            wfp.write(np.ascontiguousarray(level, dtype="<i2").tobytes())
+    os.replace(temp, path)
+
+
+def load_peaks(path: str, sourceSize: int = None, sourceMtime: float = None) -> PeakPyramid or None:
+    """
+    以内存映射方式读取峰值金字塔，源文件信息不一致时返回None
+    :param path: 缓存文件路径
+    :param sourceSize: 源文件大小
+    :param sourceMtime: 源文件修改时间
+    :return: PeakPyramid or None
+    """
+    if os.path.isfile(path) is False:
+        return None
+    try:
+        with open(path, "rb") as rfp:
+            magic, version, levelCount, sampleRate, baseBlock, numSamples, size, mtime = HEADER.unpack(
+                rfp.read(HEADER.size)
+            )
+            if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+                return None
+            if (sourceSize is not None and size != sourceSize) or \
+                    (sourceMtime is not None and mtime != sourceMtime):
+                return None
+            counts = np.frombuffer(rfp.read(8 * levelCount), dtype="<u8")
+
+        data = np.memmap(path, dtype="<i2", mode="r", offset=HEADER.size + 8 * levelCount)
+        levels = []
+        offset = 0
+        for count in counts:
+            count = int(count)
+            levels.append(data[offset:offset + count * 3].reshape(count, 3))
+            offset += count * 3
+        return PeakPyramid(levels, sampleRate, baseBlock, numSamples)
+    except (OSError, ValueError, struct.error) as e:
+        logger.error(f"读取波形缓存失败: {e}")
+        return None
+
+
+def peaks_cache_path(music_file: str) -> str:
+    """
+    获取音乐文件对应的波形缓存路径
+    :param music_file: 音乐文件路径
+    :return: str
+    """
+    cache_dir = os.path.join(PATH, "cache", "peaks")
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, track_cache_key(music_file) + ".bin")
+
+
+def get_peaks(music_file: str, loader) -> PeakPyramid or None:
+    """
+    获取音乐文件的峰值金字塔，缓存失效时才调用loader读取音频
+    :param music_file: 音乐文件路径
+    :param loader: 无参函数，返回 (int16采样, 采样率)
+    :return: PeakPyramid or None
+    """
+    cache_file = peaks_cache_path(music_file)
+    try:
+        stat = os.stat(music_file)
+    except OSError as e:
+        logger.error(f"获取波形失败: {e}")
+        return None
+
+    pyramid = load_peaks(cache_file, stat.st_size, stat.st_mtime)
+    if pyramid is not None:
+        logger.info(f"读取{music_file}的波形缓存")
+        return pyramid
+
+    logger.info(f"构建{music_file}的波形缓存")
+    samples, sampleRate = loader()
+    pyramid = build_peaks(samples, sampleRate)
+    save_peaks(pyramid, cache_file, stat.st_size, stat.st_mtime)
+    return pyramid
@@ -1,6 +1,7 @@
 import os
 import subprocess
 from PyQt5.QtCore import QThread, pyqtSignal
+from MediaTools import tool_path
 
 
 class Player(QThread):
@@ -24,7 +25,7 @@ class Player(QThread):
 
         if not self.music_process or self.music_process.poll() is not None:
             cmd = [
-                ".\\FFmpeg\\ffplay.exe",
+                tool_path("ffplay"),
                 "-i", self.audio_file,
                 "-nodisp", "-autoexit", "-exitonkeydown"
             ]
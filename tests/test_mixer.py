@@ -0,0 +1,61 @@
+import numpy as np
+from Mixer import Mixer, ArraySource, transition_jumps
+
+RATE = 44100
+
+
+def tone(seconds: float, frequency: float = 440.0, phase: float = 0.0) -> np.ndarray:
+    t = np.arange(int(round(seconds * RATE))) / RATE
+    return (0.5 * np.sin(2 * np.pi * frequency * t + phase)).astype(np.float32).reshape(-1, 1)
+
+
+def render(mixer: Mixer, block: int = 1000) -> np.ndarray:
+    blocks = []
+    while mixer.current is not None:
+        blocks.append(mixer.read(block))
+    return np.concatenate(blocks)
+
+
+def test_gapless_equals_concatenation():
+    first, second = tone(1.0), tone(0.5, 660.0)
+    mixer = Mixer(RATE, 1)
+    mixer.play(ArraySource(first), 1.0)
+    mixer.queue(ArraySource(second), 0.5)
+    out = render(mixer)
+    assert mixer.transitions == [len(first)]
+    np.testing.assert_array_equal(out, np.concatenate([first, second]))
+
+
+def test_gapless_keeps_audio_past_reported_duration():
+    # ffprobe 只精确到10毫秒：1.00秒的音源报告为0.99秒时不能丢掉最后441帧
+    first, second = tone(1.0), tone(0.5, 660.0)
+    mixer = Mixer(RATE, 1)
+    mixer.play(ArraySource(first), 0.99)
+    mixer.queue(ArraySource(second), 0.5)
+    out = render(mixer)
+    assert mixer.transitions == [len(first)]
+    assert len(out) == len(first) + len(second)
+
+
+def test_crossfade_offset():
+    first, second = tone(1.0), tone(0.5, 660.0)
+    mixer = Mixer(RATE, 1, crossfade=0.2)
+    mixer.play(ArraySource(first), 1.0)
+    mixer.queue(ArraySource(second), 0.5)
+    out = render(mixer)
+    assert mixer.transitions == [35280]
+    assert len(out) == 35280 + len(second)
+    np.testing.assert_array_equal(out[:35280], first[:35280])
+    np.testing.assert_array_equal(out[len(first):], second[len(first) - 35280:])
+
+
+def test_gapless_join_is_continuous():
+    # 同一段正弦在任意位置切开，无缝衔接后切换点不应出现突变
+    whole = tone(1.5)
+    split = 44100 + 123
+    mixer = Mixer(RATE, 1)
+    mixer.play(ArraySource(whole[:split]), split / RATE)
+    mixer.queue(ArraySource(whole[split:]), (len(whole) - split) / RATE)
+    out = render(mixer)
+    np.testing.assert_array_equal(out, whole)
+    assert transition_jumps(out, mixer.transitions)[0] < 1.1
@@ -0,0 +1,27 @@
+from TrackModel import TrackTable, TABLE_BYTES_PER_TRACK, cache_key_digest
+
+TRACKS = 20000
+
+
+def fill(count: int) -> TrackTable:
+    table = TrackTable()
+    for row in range(count):
+        path = f"/music/artist{row % 500:03d}/album{row % 40:02d}/track{row:06d}.flac"
+        table.append(path, {"duration": 240.0, "sampleRate": 44100, "gain": -6.5, "size": 30 << 20, "mtime": 1.7e9})
+    return table
+
+
+def test_bytes_per_track_within_target():
+    table = fill(TRACKS)
+    assert table.nbytes() / len(table) <= TABLE_BYTES_PER_TRACK
+
+
+def test_compact_keeps_live_rows_in_order():
+    table = fill(10)
+    for row in (0, 3, 4):
+        table.remove(row)
+    mapping = table.compact()
+    assert mapping.tolist() == [-1, 0, 1, -1, -1, 2, 3, 4, 5, 6]
+    assert len(table) == 7 and table.column("alive").all()
+    assert table.cache_key(2) == cache_key_digest(table.paths[2]).hex()
+    assert table.nbytes() / len(table) <= TABLE_BYTES_PER_TRACK